@@ -0,0 +1,104 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""
+Compares finding the copies of the affected objects through ID property tags and through the copy mapping.
+
+Usage: blender -b -P benchmarks/copy_tracking.py -- [--objects N] [--affected-ratio R]
+
+Requires the add-on to be installed (make && make install).
+"""
+
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+import addon_utils
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # noqa: E402
+
+TAG = 'wirebomb'
+
+
+def track_by_tags(scene, affected, copy):
+    """How copies were tracked before: tag, copy, untag and scan the whole new scene for tags."""
+    for obj in affected:
+        obj[TAG] = None
+
+    new_scene = copy()
+
+    for obj in affected:
+        del obj[TAG]
+
+    copies = []
+    for obj in [obj for obj in new_scene.objects if TAG in obj]:
+        del obj[TAG]
+        copies.append(obj)
+
+    return copies
+
+
+def main():
+    argv = sys.argv
+    argv = argv[argv.index('--') + 1:] if '--' in argv else []
+    parser = argparse.ArgumentParser(prog='copy_tracking.py')
+    parser.add_argument('--objects', type=int, default=50_000)
+    parser.add_argument('--affected-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if not hasattr(bpy.types.Scene, 'wirebomb'):
+        addon_utils.enable('wirebomb', default_set=False)
+    from wirebomb import utils
+
+    bpy.ops.wm.read_homefile(use_empty=True)
+    scene = bpy.context.scene
+    # tiny meshes, this measures per object overhead
+    objects = synthetic.build_scene(scene, args.objects, 1, linked_ratio=0.99, collection_depth=3, seed=args.seed)
+    affected = objects[:round(len(objects) * args.affected_ratio)]
+
+    timings = {}
+
+    start = perf_counter()
+    track_by_tags(scene, affected, lambda: utils.copy_scene(scene, 'Tags')[0])
+    timings['copy_with_tags'] = perf_counter() - start
+
+    start = perf_counter()
+    object_copies = utils.copy_scene(scene, 'Mapping')[1]
+    copies = [object_copies[obj] for obj in affected]
+    timings['copy_with_mapping'] = perf_counter() - start
+
+    start = perf_counter()
+    object_copies = utils.copy_scene(scene, 'Lean', affected, set())[1]
+    copies = [object_copies[obj] for obj in affected]
+    timings['lean_copy_with_mapping'] = perf_counter() - start
+
+    print(json.dumps({
+        'objects': args.objects,
+        'affected': len(copies),
+        'seconds': {name: round(seconds, 3) for name, seconds in timings.items()},
+        # the tracking alone, i.e. without the copy itself
+        'tag_overhead_seconds': round(timings['copy_with_tags'] - timings['copy_with_mapping'], 3),
+    }))
+
+
+if __name__ == '__main__':
+    main()
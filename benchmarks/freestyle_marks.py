@@ -0,0 +1,106 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""
+Compares per-edge and bulk Freestyle edge marking, and marking only the feature edges.
+
+Usage: blender -b -P benchmarks/freestyle_marks.py -- [--faces N] [--users N] [--triangulate] [--feature-angle DEG]
+
+The grid is flat, so with a feature angle only its boundary is marked. --triangulate adds the coplanar diagonals of
+a triangulated CAD import.
+
+Requires the add-on to be installed (make && make install).
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from time import perf_counter
+
+import bmesh
+import bpy
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # noqa: E402
+
+from wirebomb import utils  # noqa: E402
+
+
+def mark_per_edge(objects):
+    """The marking loop as it was before the bulk writer."""
+    for obj in objects:
+        for edge in obj.data.edges:
+            edge.use_freestyle_mark = True
+
+
+def clear_marks(mesh):
+    mesh.edges.foreach_set('use_freestyle_mark', np.zeros(len(mesh.edges), dtype=bool))
+
+
+def triangulate(mesh):
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bmesh.ops.triangulate(bm, faces=bm.faces)
+    bm.to_mesh(mesh)
+    bm.free()
+
+
+def main():
+    argv = sys.argv
+    argv = argv[argv.index('--') + 1:] if '--' in argv else []
+    parser = argparse.ArgumentParser(prog='freestyle_marks.py')
+    parser.add_argument('--faces', type=int, default=500_000, help="Quads in the mesh (edges are ~2x)")
+    parser.add_argument('--users', type=int, default=4, help="Objects sharing the mesh")
+    parser.add_argument('--triangulate', action='store_true', help="Split every quad into two triangles")
+    parser.add_argument('--feature-angle', type=float, default=30, help="Feature angle in degrees")
+    args = parser.parse_args(argv)
+
+    mesh = synthetic.make_grid_mesh('Benchmark Grid', args.faces)
+    if args.triangulate:
+        triangulate(mesh)
+    objects = [bpy.data.objects.new(f'Benchmark Grid {i}', mesh) for i in range(args.users)]
+
+    start = perf_counter()
+    mark_per_edge(objects)
+    per_edge = perf_counter() - start
+
+    clear_marks(mesh)
+
+    start = perf_counter()
+    utils.mark_freestyle_edges(obj.data for obj in objects)
+    bulk = perf_counter() - start
+
+    start = perf_counter()
+    n_features = utils.mark_freestyle_edges((obj.data for obj in objects), math.radians(args.feature_angle))
+    features = perf_counter() - start
+
+    print(json.dumps({
+        'edges': len(mesh.edges),
+        'users': args.users,
+        'per_edge_seconds': round(per_edge, 4),
+        'bulk_seconds': round(bulk, 4),
+        'speedup': round(per_edge / bulk, 1) if bulk else None,
+        'feature_seconds': round(features, 4),
+        'feature_edges': n_features,
+    }))
+
+
+if __name__ == '__main__':
+    main()
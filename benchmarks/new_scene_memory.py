@@ -0,0 +1,109 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""
+Compares the peak memory of a setup in a full scene copy and in a lean copy sharing unaffected data.
+
+Usage: blender -b -P benchmarks/new_scene_memory.py -- [--objects N] [--faces N] [--affected-ratio R] [--method M]
+
+Every mode runs in its own Blender process, see synthetic.run_variants, and peak memory is only read on Linux and
+macOS.
+
+Requires the add-on to be installed (make && make install).
+"""
+
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+import addon_utils
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # noqa: E402
+
+
+def run_mode(args):
+    if not hasattr(bpy.types.Scene, 'wirebomb'):
+        addon_utils.enable('wirebomb', default_set=False)
+    from wirebomb import wirebomb
+
+    bpy.ops.wm.read_homefile(use_empty=True)
+    scene = bpy.context.scene
+    objects = synthetic.build_scene(scene, args.objects, args.faces, linked_ratio=0.0, seed=args.seed)
+
+    settings = scene.wirebomb
+    settings.use_lean_copy = args.mode == 'LEAN'
+    settings.use_wireframe = args.method != 'NONE'
+    if settings.use_wireframe:
+        settings.wireframe_method = args.method
+    # affecting the first part of the objects through a collection
+    affected = bpy.data.collections.new('Affected')
+    scene.collection.children.link(affected)
+    for obj in objects[:round(len(objects) * args.affected_ratio)]:
+        affected.objects.link(obj)
+    settings.affect_mode = 'INCLUSIVE'
+    settings.use_affect_collections = True
+    settings.collections_affected.add().value = affected
+
+    baseline = synthetic.peak_rss_mb()
+    start = perf_counter()
+    result = wirebomb.set_up(scene)
+    seconds = perf_counter() - start
+
+    synthetic.print_result({
+        'mode': args.mode,
+        'error': result.error_msg,
+        'seconds': round(seconds, 3),
+        'baseline_peak_mb': round(baseline, 1),
+        'peak_mb': round(synthetic.peak_rss_mb(), 1),
+        'added_peak_mb': round(synthetic.peak_rss_mb() - baseline, 1),
+    })
+
+
+def main():
+    argv = sys.argv
+    argv = argv[argv.index('--') + 1:] if '--' in argv else []
+    parser = argparse.ArgumentParser(prog='new_scene_memory.py')
+    parser.add_argument('--objects', type=int, default=200)
+    parser.add_argument('--faces', type=int, default=50_000)
+    parser.add_argument('--affected-ratio', type=float, default=0.1, help="Fraction of objects affected")
+    parser.add_argument('--method', choices=('FREESTYLE', 'MODIFIER', 'NONE'), default='NONE',
+                        help="Wireframe method, NONE only sets up the base material")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=('FULL', 'LEAN'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    results = synthetic.run_variants(os.path.abspath(__file__), argv, '--mode', ('FULL', 'LEAN'))
+
+    print(json.dumps({
+        'objects': args.objects,
+        'faces_per_mesh': args.faces,
+        'affected_ratio': args.affected_ratio,
+        'method': args.method,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
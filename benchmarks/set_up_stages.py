@@ -0,0 +1,113 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""
+Times every stage of a setup on seeded synthetic scenes.
+
+Usage: blender -b -P benchmarks/set_up_stages.py -- [--objects N ...] [--faces N ...] [--output FILE] ...
+
+Every combination of the given object and face counts is benchmarked in a fresh file. One JSON object per run is
+printed and, with --output, written to a JSON file as a list.
+
+Requires the add-on to be installed (make && make install).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import addon_utils
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # noqa: E402
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='set_up_stages.py')
+    parser.add_argument('--objects', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--faces', type=int, nargs='+', default=[1000])
+    parser.add_argument('--linked-ratio', type=float, default=0.5, help="Fraction of objects sharing a mesh")
+    parser.add_argument('--collection-depth', type=int, default=3)
+    parser.add_argument('--view-layers', type=int, default=1)
+    parser.add_argument('--method', choices=('FREESTYLE', 'MODIFIER'), default='FREESTYLE')
+    parser.add_argument('--no-new-scene', action='store_true', help="Set up the scene in place")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON file to write the results to")
+    return parser.parse_args(argv)
+
+
+def run(args, n_objects, n_faces):
+    from wirebomb import wirebomb
+
+    bpy.ops.wm.read_homefile(use_empty=True)
+    scene = bpy.context.scene
+    synthetic.build_scene(scene, n_objects, n_faces, args.linked_ratio, args.collection_depth, args.view_layers,
+                          args.seed)
+
+    settings = scene.wirebomb
+    settings.use_new_scene = not args.no_new_scene
+    settings.wireframe_method = args.method
+    settings.use_ao = True
+
+    settings.use_stats = True
+    settings.stats_path = ''
+
+    engine = wirebomb.Wirebomb(scene)
+    engine.set_up_new()
+    # the stages as timed by the setup itself, the parts run in chunks are summed
+    timings = engine.stats.to_dict()['stages']
+
+    return {
+        'objects': n_objects,
+        'faces_per_mesh': n_faces,
+        'unique_meshes': len(engine.mesh_users),
+        'linked_ratio': args.linked_ratio,
+        'collection_depth': args.collection_depth,
+        'view_layers': args.view_layers,
+        'method': args.method,
+        'new_scene': settings.use_new_scene,
+        'seed': args.seed,
+        'blender': bpy.app.version_string,
+        'stages': timings,
+        'total': round(sum(timings.values()), 4),
+    }
+
+
+def main():
+    argv = sys.argv
+    argv = argv[argv.index('--') + 1:] if '--' in argv else []
+    args = parse_args(argv)
+
+    if not hasattr(bpy.types.Scene, 'wirebomb'):
+        addon_utils.enable('wirebomb', default_set=False)
+
+    results = []
+    for n_objects, n_faces in itertools.product(args.objects, args.faces):
+        result = run(args, n_objects, n_faces)
+        print(json.dumps(result), flush=True)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
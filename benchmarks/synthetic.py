@@ -0,0 +1,159 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""Helpers for building synthetic benchmark data in background Blender, and for running benchmarks."""
+
+import json
+import math
+import subprocess
+import sys
+
+import bpy
+import numpy as np
+
+# prefix of the line a benchmark's Blender process prints its result on, everything else Blender prints is ignored
+RESULT_PREFIX = 'WIREBOMB_RESULT '
+
+
+def make_grid_mesh(name, faces):
+    """
+    Creates a square grid mesh built from bulk array writes.
+
+    :param name: Name of the new mesh.
+    :param faces: Approximate number of quads in the grid, the edge count is roughly twice this.
+    :return: The new mesh.
+    """
+    side = max(1, int(math.sqrt(faces)))
+    n_verts = (side + 1) ** 2
+    n_faces = side ** 2
+
+    xs, ys = np.meshgrid(np.arange(side + 1, dtype=np.float32), np.arange(side + 1, dtype=np.float32))
+    co = np.column_stack((xs.ravel(), ys.ravel(), np.zeros(n_verts, dtype=np.float32)))
+
+    rows, cols = np.meshgrid(np.arange(side), np.arange(side), indexing='ij')
+    first = (rows * (side + 1) + cols).ravel()
+    loops = np.column_stack((first, first + 1, first + side + 2, first + side + 1)).astype(np.int32)
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(n_verts)
+    mesh.vertices.foreach_set('co', co.ravel())
+    mesh.loops.add(n_faces * 4)
+    mesh.loops.foreach_set('vertex_index', loops.ravel())
+    mesh.polygons.add(n_faces)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, n_faces * 4, 4, dtype=np.int32))
+    mesh.polygons.foreach_set('loop_total', np.full(n_faces, 4, dtype=np.int32))
+    mesh.update(calc_edges=True)
+    mesh.validate()
+
+    return mesh
+
+
+def build_scene(scene, objects, faces, linked_ratio=0.0, collection_depth=1, view_layers=1, seed=0):
+    """
+    Fills a scene with seeded, randomly placed grid objects.
+
+    :param scene: The scene to fill, normally an empty one.
+    :param objects: Number of mesh objects to create.
+    :param faces: Approximate number of faces per mesh.
+    :param linked_ratio: Fraction of objects that are linked duplicates of another object's mesh.
+    :param collection_depth: Depth of the collection hierarchy the objects are spread over, 0 puts them all in the
+    scene collection.
+    :param view_layers: Total number of view layers of the scene.
+    :param seed: Random seed, the same parameters and seed always give the same scene.
+    :return: The created objects.
+    """
+    rng = np.random.RandomState(seed)
+
+    # a chain of nested collections with a sibling at every level, to get both depth and overlap-free breadth
+    collections = [scene.collection]
+    parent = scene.collection
+    for depth in range(collection_depth):
+        for sibling in range(2):
+            coll = bpy.data.collections.new(f'Benchmark {depth}.{sibling}')
+            parent.children.link(coll)
+            collections.append(coll)
+        parent = collections[-1]
+
+    n_meshes = max(1, round(objects * (1 - linked_ratio)))
+    meshes = [make_grid_mesh(f'Benchmark Mesh {i}', faces) for i in range(n_meshes)]
+    # every mesh is used at least once, the remaining objects are linked duplicates
+    mesh_indices = np.concatenate((np.arange(n_meshes), rng.randint(0, n_meshes, max(0, objects - n_meshes))))
+    coll_indices = rng.randint(0, len(collections), objects)
+    locations = rng.uniform(-100, 100, (objects, 3))
+
+    created = []
+    for i in range(objects):
+        obj = bpy.data.objects.new(f'Benchmark Object {i}', meshes[mesh_indices[i]])
+        obj.location = locations[i]
+        collections[coll_indices[i]].objects.link(obj)
+        created.append(obj)
+
+    for i in range(len(scene.view_layers), view_layers):
+        scene.view_layers.new(f'Benchmark Layer {i}')
+
+    return created
+
+
+def add_camera(scene):
+    """Adds a camera framing the objects build_scene places, and makes it the scene's camera."""
+    camera = bpy.data.objects.new('Benchmark Camera', bpy.data.cameras.new('Benchmark Camera'))
+    camera.location = (0, -250, 150)
+    camera.rotation_euler = (0.9, 0, 0)
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+
+    return camera
+
+
+def peak_rss_mb():
+    """
+    :return: The peak resident set size of this process in megabytes. Read with the resource module, so this works on
+    Linux and macOS only.
+    """
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def print_result(result):
+    """Prints the result of a benchmark run for run_variants."""
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def run_variants(script, argv, option, variants):
+    """
+    Runs a benchmark script once per variant, every variant in its own Blender process, since the peak resident set
+    size of a process never goes down.
+
+    :param script: The path of the benchmark script.
+    :param argv: The script's arguments.
+    :param option: The hidden option selecting the variant in the script, e.g. '--method'.
+    :param variants: The values of the option to run.
+    :return: A dict mapping each variant to the result its process printed with print_result. Variants whose process
+    failed before printing are left out.
+    """
+    results = {}
+    for variant in variants:
+        process = subprocess.run([bpy.app.binary_path, '-b', '-P', script, '--'] + argv + [option, variant],
+                                 stdout=subprocess.PIPE, universal_newlines=True)
+        for line in process.stdout.splitlines():
+            if line.startswith(RESULT_PREFIX):
+                results[variant] = json.loads(line[len(RESULT_PREFIX):])
+
+    return results
@@ -0,0 +1,143 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""
+Compares the setup time, evaluated geometry, peak memory and render time of the wireframe methods.
+
+Usage: blender -b -P benchmarks/wireframe_methods.py -- [--engine BLENDER_EEVEE|CYCLES] [--resolution X Y]
+       [--frames N] [--objects N] [--faces N] [--methods M...]
+
+Every method runs in its own Blender process, see synthetic.run_variants, and peak memory is only read on Linux and
+macOS. EEVEE needs a GPU even in background mode.
+
+Requires the add-on to be installed (make && make install).
+"""
+
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+
+import addon_utils
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic  # noqa: E402
+
+METHODS = ('FREESTYLE', 'MODIFIER', 'SHADER')
+
+
+def count_evaluated_faces(scene, view_layer):
+    """Evaluates the scene and counts the faces of all evaluated meshes, e.g. including generated wireframes."""
+    depsgraph = scene.view_layers[view_layer.name].depsgraph
+    start = perf_counter()
+    depsgraph.update()
+    seconds = perf_counter() - start
+
+    faces = 0
+    for instance in depsgraph.object_instances:
+        if instance.object.type == 'MESH':
+            faces += len(instance.object.data.polygons)
+
+    return faces, seconds
+
+
+def run_method(args):
+    if not hasattr(bpy.types.Scene, 'wirebomb'):
+        addon_utils.enable('wirebomb', default_set=False)
+    from wirebomb import wirebomb
+
+    bpy.ops.wm.read_homefile(use_empty=True)
+    scene = bpy.context.scene
+    synthetic.build_scene(scene, args.objects, args.faces, linked_ratio=0.5, seed=args.seed)
+    synthetic.add_camera(scene)
+
+    render = scene.render
+    render.engine = args.engine
+    render.resolution_x, render.resolution_y = args.resolution
+    render.resolution_percentage = 100
+    scene.cycles.samples = args.samples
+    scene.eevee.taa_render_samples = args.samples
+
+    settings = scene.wirebomb
+    settings.wireframe_method = args.method
+    settings.use_ao = False
+    settings.use_new_scene = False
+    settings.use_stats = True
+
+    baseline = synthetic.peak_rss_mb()
+    result = wirebomb.set_up(scene)
+    faces, depsgraph_seconds = count_evaluated_faces(result.scene, result.view_layer)
+    setup_peak = synthetic.peak_rss_mb()
+
+    frame_seconds = []
+    for frame in range(args.frames):
+        scene.frame_set(scene.frame_start + frame)
+        start = perf_counter()
+        bpy.ops.render.render(scene=result.scene.name)
+        frame_seconds.append(perf_counter() - start)
+
+    synthetic.print_result({
+        'method': args.method,
+        'error': result.error_msg,
+        'setup_seconds': round(result.seconds, 3),
+        'stages': result.stats.to_dict()['stages'],
+        'evaluated_faces': faces,
+        'depsgraph_seconds': round(depsgraph_seconds, 3),
+        'setup_peak_mb': round(setup_peak - baseline, 1),
+        # the first frame includes shader compilation and data sync
+        'first_frame_seconds': round(frame_seconds[0], 3) if frame_seconds else None,
+        'mean_frame_seconds': round(sum(frame_seconds[1:]) / max(1, len(frame_seconds) - 1), 3),
+        'peak_mb': round(synthetic.peak_rss_mb(), 1),
+    })
+
+
+def main():
+    argv = sys.argv
+    argv = argv[argv.index('--') + 1:] if '--' in argv else []
+    parser = argparse.ArgumentParser(prog='wireframe_methods.py')
+    parser.add_argument('--engine', choices=('BLENDER_EEVEE', 'CYCLES'), default='BLENDER_EEVEE')
+    parser.add_argument('--resolution', type=int, nargs=2, default=[1920, 1080])
+    parser.add_argument('--samples', type=int, default=16)
+    parser.add_argument('--frames', type=int, default=3)
+    parser.add_argument('--objects', type=int, default=200)
+    parser.add_argument('--faces', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=METHODS)
+    parser.add_argument('--method', choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.method:
+        run_method(args)
+        return
+
+    results = synthetic.run_variants(os.path.abspath(__file__), argv, '--method', args.methods)
+
+    print(json.dumps({
+        'engine': args.engine,
+        'resolution': args.resolution,
+        'samples': args.samples,
+        'frames': args.frames,
+        'objects': args.objects,
+        'faces_per_mesh': args.faces,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
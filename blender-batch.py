@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import addon_utils
+import bpy
+
+ADDON_NAME = 'wirebomb'
+# prefix of the line a worker prints its result on, everything else Blender prints is ignored
+RESULT_PREFIX = 'WIREBOMB_RESULT '
+
+USAGE = """
+Sets up many .blend files for wireframe rendering using background Blender processes.
+
+    blender -b -P blender-batch.py -- --output DIR [--farm] [--config FILE] [--jobs N] [--log FILE] FILE...
+    blender -b -P blender-batch.py -- --plan [--config FILE] [--jobs N] [--log FILE] FILE...
+
+The configuration is a Wirebomb profile, i.e. a JSON object of Wirebomb settings, e.g.
+{"wireframe_method": "MODIFIER", "use_ao": true, "material_base": {"color": [1, 1, 1, 1]}}
+Profiles can be saved from the Wirebomb panel.
+
+With --farm, each job runs a second Blender process for the export once its file is saved, so only half as many jobs
+run at a time. --farm-compare also times loading the set up copy and the export, which opens both files again.
+"""
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='blender-batch.py', usage=USAGE)
+    parser.add_argument('files', nargs='*', help="The .blend files to set up")
+    parser.add_argument('--output', help="Directory to save the set up files to")
+    parser.add_argument('--config', help="JSON file with the Wirebomb settings to use")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help="Number of parallel Blender processes, jobs with --farm count as two")
+    parser.add_argument('--log', help="Also append the JSON result lines to this file")
+    parser.add_argument('--plan', action='store_true',
+                        help="Only estimate what setting up each file would do and cost, nothing is saved")
+    parser.add_argument('--farm', action='store_true',
+                        help="Also export each set up scene to a .farm.blend that renders without the add-on")
+    parser.add_argument('--farm-compare', action='store_true',
+                        help="With --farm, also compare the size and load time of the export with the set up copy's")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    # the profile as compiled by the driver, so that workers don't read and validate it again
+    parser.add_argument('--compiled-config', help=argparse.SUPPRESS)
+    # where a worker saves its file, chosen by the driver
+    parser.add_argument('--output-file', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if not args.output and not args.plan:
+        parser.error("the following arguments are required: --output")
+    return args
+
+
+def run_worker(args):
+    """Sets up the currently open file, saves it and prints the result."""
+    result = {'file': bpy.data.filepath, 'status': 'ok'}
+
+    try:
+        if not hasattr(bpy.types.Scene, ADDON_NAME):
+            addon_utils.enable(ADDON_NAME, default_set=False)
+        from wirebomb import farm, plan, profiles, wirebomb
+
+        scene = bpy.context.scene
+        if args.compiled_config:
+            profiles.CompiledProfile.read_json(args.compiled_config).apply(scene.wirebomb)
+
+        if args.plan:
+            setup_plan = plan.make_plan(scene)
+            result.update(setup_plan.to_dict())
+            del result['error']
+            if not setup_plan.succeeded:
+                raise RuntimeError(setup_plan.error_msg)
+            print(RESULT_PREFIX + json.dumps(result), flush=True)
+            return
+
+        setup = wirebomb.set_up(scene)
+        result.update(setup.to_dict())
+        result['setup_seconds'] = result.pop('seconds')
+        del result['error']
+        if not setup.succeeded:
+            raise RuntimeError(setup.error_msg)
+
+        start = perf_counter()
+        output_path = args.output_file
+        bpy.ops.wm.save_as_mainfile(filepath=output_path, copy=True)
+        result['save_seconds'] = round(perf_counter() - start, 3)
+        result['output'] = output_path
+
+        if args.farm:
+            farm_path = os.path.splitext(output_path)[0] + '.farm.blend'
+            export = farm.export_for_farm(setup.scene, farm_path,
+                                          compare_filepath=output_path if args.farm_compare else None)
+            if not export.succeeded:
+                raise RuntimeError(export.error_msg)
+            result['farm'] = export.to_dict()
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def set_up_file(filepath, worker_argv):
+    """Runs a worker process on a file and returns its result."""
+    start = perf_counter()
+    process = subprocess.run(
+        [bpy.app.binary_path, '-b', filepath, '-P', os.path.abspath(__file__), '--', '--worker'] + worker_argv,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+
+    result = None
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+
+    if result is None:
+        # the worker died before reporting, e.g. on a file that fails to load
+        result = {'file': filepath, 'status': 'error', 'error': f'Worker exited with code {process.returncode}'}
+    result['wall_seconds'] = round(perf_counter() - start, 3)
+
+    return result
+
+
+def compile_config(filepath, compiled_path):
+    """
+    Validates and compiles the profile once, before any worker starts, and saves the compiled profile for the workers
+    to apply. Exits if the profile can't be read or is invalid.
+    """
+    if not hasattr(bpy.types.Scene, ADDON_NAME):
+        addon_utils.enable(ADDON_NAME, default_set=False)
+    from wirebomb import profiles
+
+    try:
+        profiles.load_profile(filepath).write_json(compiled_path)
+    except OSError as e:
+        sys.exit(f"Can't read profile {filepath}: {e.strerror}")
+    except profiles.ProfileError as e:
+        sys.exit(f'Invalid profile {filepath}: {e}')
+
+
+def get_output_paths(files, output_dir):
+    """
+    Maps each input file to where its set up copy is saved. The files' paths below the directory they have in common
+    are kept, so that files with the same name in different directories don't overwrite each other.
+
+    Exits if a copy would overwrite an input file.
+    """
+    root = os.path.commonpath([os.path.dirname(f) for f in files]) if files else ''
+    inputs = {os.path.normcase(f) for f in files}
+
+    output_paths = {}
+    for filepath in files:
+        output_path = os.path.join(os.path.abspath(output_dir), os.path.relpath(filepath, root))
+        if os.path.normcase(output_path) in inputs:
+            sys.exit(f'Saving to {output_path} would overwrite an input file, choose another output directory')
+        output_paths[filepath] = output_path
+
+    return output_paths
+
+
+def run_driver(args, compiled_config=None):
+    """
+    Distributes the files over a pool of worker processes and prints one JSON line per file.
+
+    :param compiled_config: The compiled profile to apply, see compile_config.
+    """
+    files = list(dict.fromkeys(os.path.abspath(f) for f in args.files))
+    if args.plan:
+        worker_argv = ['--plan']
+        output_paths = None
+    else:
+        output_paths = get_output_paths(files, args.output)
+        for output_path in output_paths.values():
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        worker_argv = ['--output', os.path.abspath(args.output)]
+        if args.farm:
+            worker_argv += ['--farm'] + (['--farm-compare'] if args.farm_compare else [])
+    if compiled_config:
+        worker_argv += ['--compiled-config', compiled_config]
+
+    def set_up(filepath):
+        return set_up_file(filepath, worker_argv + (['--output-file', output_paths[filepath]] if output_paths else []))
+
+    log = open(args.log, 'a') if args.log else None
+    failed = 0
+
+    # a farm export runs a Blender process of its own while the worker waits for it
+    jobs = args.jobs // 2 if args.farm and not args.plan else args.jobs
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for result in pool.map(set_up, files):
+            line = json.dumps(result)
+            print(line, flush=True)
+            if log:
+                log.write(line + '\n')
+                log.flush()
+            failed += result['status'] != 'ok'
+
+    if log:
+        log.close()
+
+    return failed
+
+
+def main():
+    argv = sys.argv
+    argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+    else:
+        with tempfile.TemporaryDirectory(prefix='wirebomb-batch-') as temp_dir:
+            compiled_config = None
+            if args.config:
+                compiled_config = os.path.join(temp_dir, 'profile.json')
+                compile_config(args.config, compiled_config)
+            failed = run_driver(args, compiled_config)
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -37,6 +37,13 @@ module_names = (
     'props',
     'ui',
     'ui_presets',
+    'farm',
+    'geometry',
+    'plan',
+    'profiles',
+    'selection',
+    'stats',
+    'teardown',
     'utils',
     'wirebomb'
 )
@@ -0,0 +1,258 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""
+Render farm export: writes a set up scene to a .blend of its own, with nothing the add-on is needed for.
+
+The scene and its dependencies are written with bpy.data.libraries.write. A background Blender process then opens
+that file without the add-on, replaces the drivers following the Wirebomb settings with the values they have now,
+removes the settings and every other scene, and saves it. Data only the removed scenes used isn't saved.
+
+This module also is the script the background process runs, so it only imports what Blender has without the add-on.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+import bpy
+
+# prefix of the line the background process prints its result on
+RESULT_PREFIX = 'WIREBOMB_RESULT '
+# the settings' name on scenes, the drivers following them have data paths starting with this
+SETTINGS_PROP = 'wirebomb'
+# ID property of materials created by the add-on, see utils.MATERIAL_ROLE_PROP
+MATERIAL_ROLE_PROP = 'wirebomb_role'
+# ID property of meshes marked by the add-on, see utils.FREESTYLE_MARKS_PROP
+FREESTYLE_MARKS_PROP = 'wirebomb_freestyle_marks'
+
+# the data block collections whose data blocks, or whose embedded node trees, may have drivers
+DRIVEN_COLLECTIONS = ('materials', 'objects', 'linestyles', 'node_groups', 'scenes', 'worlds')
+
+
+class FarmExportResult:
+    """The outcome of a render farm export."""
+
+    def __init__(self, filepath, error_msg, drivers_frozen=0, size=0, load_seconds=0.0, original_size=None,
+                 original_load_seconds=None, seconds=0.0):
+        self.filepath = filepath
+        # empty iff the export succeeded
+        self.error_msg = error_msg
+        self.drivers_frozen = drivers_frozen
+        # bytes
+        self.size = size
+        self.load_seconds = load_seconds
+        # of the file compared with, None if there was none
+        self.original_size = original_size
+        self.original_load_seconds = original_load_seconds
+        self.seconds = seconds
+
+    @property
+    def succeeded(self):
+        return not self.error_msg
+
+    def to_dict(self):
+        return {
+            'output': self.filepath,
+            'error': self.error_msg,
+            'drivers_frozen': self.drivers_frozen,
+            'megabytes': round(self.size / 2 ** 20, 2),
+            'load_seconds': round(self.load_seconds, 3),
+            'original_megabytes': round(self.original_size / 2 ** 20, 2) if self.original_size is not None else None,
+            'original_load_seconds': (round(self.original_load_seconds, 3)
+                                      if self.original_load_seconds is not None else None),
+            'seconds': round(self.seconds, 3),
+        }
+
+    def summary(self):
+        """
+        :return: A one-line human readable summary, suitable for an operator report.
+        """
+        summary = f'{self.size / 2 ** 20:.1f} MB, loads in {self.load_seconds:.2f}s'
+        if self.original_size is not None:
+            summary += f' (was {self.original_size / 2 ** 20:.1f} MB, {self.original_load_seconds:.2f}s)'
+        return f'{summary}, {self.drivers_frozen} drivers frozen'
+
+
+def get_driven_ids():
+    """
+    Yields every data block that may have drivers, with how to find it again in a file of its own: the name of its
+    collection in bpy.data, its name, and the attribute holding it if it's an embedded node tree.
+    """
+    for collection_name in DRIVEN_COLLECTIONS:
+        for id_data in getattr(bpy.data, collection_name):
+            yield (collection_name, id_data.name, None), id_data
+            node_tree = getattr(id_data, 'node_tree', None)
+            if node_tree is not None:
+                yield (collection_name, id_data.name, 'node_tree'), node_tree
+
+
+def find_id(key):
+    collection_name, name, embedded = key
+    id_data = getattr(bpy.data, collection_name).get(name)
+    return getattr(id_data, embedded) if id_data is not None and embedded else id_data
+
+
+def get_frozen_values():
+    """
+    Finds the current values of everything driven by the Wirebomb settings.
+
+    The setup's drivers each have a single variable reading a setting, so a driven value is the setting's value.
+
+    :return: A list of (data block key, data path, array index, value), see get_driven_ids for the keys.
+    """
+    frozen = []
+    for key, id_data in get_driven_ids():
+        anim_data = id_data.animation_data
+        if not anim_data:
+            continue
+
+        for fcurve in anim_data.drivers:
+            variables = fcurve.driver.variables
+            if len(variables) != 1:
+                continue
+            target = variables[0].targets[0]
+            if not target.id or not target.data_path.startswith(SETTINGS_PROP + '.'):
+                continue
+            frozen.append((key, fcurve.data_path, fcurve.array_index, target.id.path_resolve(target.data_path)))
+
+    return frozen
+
+
+def export_for_farm(scene, filepath, compress=False, compare_filepath=None):
+    """
+    Writes a scene to a .blend of its own for rendering on machines without the add-on.
+
+    :param scene: The scene to export, normally a set up scene.
+    :param filepath: The .blend file to write.
+    :param compress: Whether to compress the file, smaller but slower to load.
+    :param compare_filepath: A .blend file to also measure, for comparison, e.g. the set up file as saved.
+    :return: A FarmExportResult.
+    """
+    start = perf_counter()
+    filepath = os.path.abspath(bpy.path.abspath(filepath))
+    temp_dir = tempfile.mkdtemp(prefix='wirebomb-farm-')
+    try:
+        values_path = os.path.join(temp_dir, 'values.json')
+        with open(values_path, 'w') as f:
+            json.dump(get_frozen_values(), f)
+
+        # the scene with everything it depends on, including data that is removed in the background process
+        partial_path = os.path.join(temp_dir, 'partial.blend')
+        bpy.data.libraries.write(partial_path, {scene}, relative_remap=True)
+
+        argv = ['--values', values_path, '--scene', scene.name, '--output', filepath]
+        if compress:
+            argv.append('--compress')
+        if compare_filepath:
+            argv += ['--compare', os.path.abspath(bpy.path.abspath(compare_filepath))]
+        process = subprocess.run([bpy.app.binary_path, '-b', '--factory-startup', partial_path,
+                                  '-P', os.path.abspath(__file__), '--'] + argv,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+            return FarmExportResult(filepath, '', seconds=perf_counter() - start, **result)
+
+    return FarmExportResult(filepath, f'The export process exited with code {process.returncode}',
+                            seconds=perf_counter() - start)
+
+
+def time_load(filepath):
+    start = perf_counter()
+    bpy.ops.wm.open_mainfile(filepath=filepath, load_ui=False)
+    return perf_counter() - start
+
+
+def freeze_and_save(args):
+    """Run in the background process, on the partially written file."""
+    with open(args.values) as f:
+        frozen = json.load(f)
+
+    n_frozen = 0
+    for key, data_path, index, value in frozen:
+        id_data = find_id(key)
+        if id_data is None or not id_data.animation_data:
+            # not a dependency of the scene
+            continue
+
+        fcurve = id_data.animation_data.drivers.find(data_path, index=index)
+        if fcurve:
+            id_data.animation_data.drivers.remove(fcurve)
+        prop_owner, _, prop_name = data_path.rpartition('.')
+        owner = id_data.path_resolve(prop_owner) if prop_owner else id_data
+        if owner.bl_rna.properties[prop_name].is_array:
+            getattr(owner, prop_name)[index] = value
+        else:
+            setattr(owner, prop_name, value)
+        n_frozen += 1
+
+    scene = bpy.data.scenes[args.scene]
+    window = bpy.context.window
+    if window:
+        window.scene = scene
+    bpy.data.batch_remove([other for other in bpy.data.scenes if other != scene])
+
+    # the add-on's data, unreadable without it
+    if SETTINGS_PROP in scene:
+        del scene[SETTINGS_PROP]
+    for material in bpy.data.materials:
+        if MATERIAL_ROLE_PROP in material:
+            del material[MATERIAL_ROLE_PROP]
+    for mesh in bpy.data.meshes:
+        if FREESTYLE_MARKS_PROP in mesh:
+            del mesh[FREESTYLE_MARKS_PROP]
+
+    # data only the removed scenes used has no users left and isn't saved
+    bpy.ops.wm.save_as_mainfile(filepath=args.output, compress=args.compress, relative_remap=True)
+
+    result = {
+        'drivers_frozen': n_frozen,
+        'size': os.path.getsize(args.output),
+        'load_seconds': time_load(args.output),
+    }
+    if args.compare:
+        result['original_size'] = os.path.getsize(args.compare)
+        result['original_load_seconds'] = time_load(args.compare)
+
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def main():
+    argv = sys.argv
+    argv = argv[argv.index('--') + 1:] if '--' in argv else []
+    parser = argparse.ArgumentParser(prog='farm.py')
+    parser.add_argument('--values', required=True)
+    parser.add_argument('--scene', required=True)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--compare')
+    freeze_and_save(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
+else:
+    register, unregister = bpy.utils.register_classes_factory(())
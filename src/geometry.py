@@ -0,0 +1,142 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+import bpy
+import numpy as np
+
+# bytes per element of an evaluated mesh (MVert, MEdge, MPoly and MLoop in Blender 2.83)
+VERTEX_BYTES = 20
+EDGE_BYTES = 12
+FACE_BYTES = 12
+LOOP_BYTES = 8
+
+# modifiers that subdivide every face into quads, by the property holding their render level
+SUBDIVISION_LEVELS = {
+    'SUBSURF': 'render_levels',
+    'MULTIRES': 'render_levels',
+}
+
+
+class GeometryEstimate:
+    """Estimated geometry of affected objects once a wireframe modifier is added, one array entry per object."""
+
+    def __init__(self, objects, vertices, edges, faces, loops):
+        self.objects = objects
+        self.vertices = vertices
+        self.edges = edges
+        self.faces = faces
+        self.loops = loops
+
+    @property
+    def bytes(self):
+        return (self.vertices * VERTEX_BYTES + self.edges * EDGE_BYTES + self.faces * FACE_BYTES
+                + self.loops * LOOP_BYTES)
+
+    def find_over_budget(self, max_faces, max_bytes):
+        """
+        Finds the objects to leave out to stay within a budget, the largest are left out first.
+
+        :param max_faces: The maximum number of faces of any one object, 0 for no limit.
+        :param max_bytes: The maximum memory of all objects together, 0 for no limit.
+        :return: A bool array of whether each object is over the budget.
+        """
+        over = self.faces > max_faces if max_faces else np.zeros(len(self.objects), dtype=bool)
+
+        if max_bytes:
+            object_bytes = np.where(over, 0, self.bytes)
+            # keeping the smallest objects, which keeps as many objects as possible
+            order = np.argsort(object_bytes, kind='stable')
+            over[order[np.cumsum(object_bytes[order]) > max_bytes]] = True
+
+        return over
+
+    def to_dict(self):
+        return {
+            'objects': len(self.objects),
+            'vertices': int(self.vertices.sum()),
+            'edges': int(self.edges.sum()),
+            'faces': int(self.faces.sum()),
+            'megabytes': round(float(self.bytes.sum()) / 2 ** 20, 1),
+            'max_object_faces': int(self.faces.max()) if len(self.objects) else 0,
+        }
+
+
+def count_mesh(mesh):
+    """
+    :return: The number of vertices, edges, faces and face corners (loops) of a mesh.
+    """
+    return len(mesh.vertices), len(mesh.edges), len(mesh.polygons), len(mesh.loops)
+
+
+def mesh_bytes(mesh):
+    """
+    :return: The approximate memory of a mesh's geometry.
+    """
+    vertices, edges, faces, loops = count_mesh(mesh)
+    return vertices * VERTEX_BYTES + edges * EDGE_BYTES + faces * FACE_BYTES + loops * LOOP_BYTES
+
+
+def get_subdivision_levels(obj):
+    """
+    :return: The number of times the object's modifiers subdivide it when rendering.
+    """
+    return sum(getattr(mod, SUBDIVISION_LEVELS[mod.type]) for mod in obj.modifiers
+               if mod.type in SUBDIVISION_LEVELS and mod.show_render)
+
+
+def estimate_wireframe(objects):
+    """
+    Estimates the geometry objects will have when rendered with a wireframe modifier added last, without evaluating
+    anything.
+
+    The counts are read once per unique mesh, all the estimating is done for all objects at once. Modifiers other than
+    subdivision are assumed not to change the amount of geometry.
+
+    :param objects: The mesh objects.
+    :return: A GeometryEstimate.
+    """
+    objects = list(objects)
+    mesh_counts = {}
+    counts = np.empty((len(objects), 4), dtype=np.int64)
+    levels = np.empty(len(objects), dtype=np.int64)
+    for i, obj in enumerate(objects):
+        mesh = obj.data
+        mesh_count = mesh_counts.get(mesh)
+        if mesh_count is None:
+            mesh_count = mesh_counts[mesh] = count_mesh(mesh)
+        counts[i] = mesh_count
+        levels[i] = get_subdivision_levels(obj)
+    vertices, edges, faces, loops = counts.T.copy()
+
+    # Catmull-Clark: a vertex per vertex, edge and face, two edges per edge and one per corner, a quad per corner
+    for level in range(int(levels.max()) if len(objects) else 0):
+        subdivided = levels > level
+        vertices = np.where(subdivided, vertices + edges + faces, vertices)
+        edges, faces, loops = (np.where(subdivided, 2 * edges + loops, edges),
+                               np.where(subdivided, loops, faces),
+                               np.where(subdivided, 4 * loops, loops))
+
+    # the wireframe modifier keeps the original geometry (use_replace is off), and adds two vertices per corner and
+    # a quad on each side of every edge of every face, i.e. two quads per corner
+    return GeometryEstimate(objects,
+                            vertices + 2 * loops,
+                            edges + 4 * loops,
+                            faces + 2 * loops,
+                            loops + 8 * loops)
+
+
+register, unregister = bpy.utils.register_classes_factory(())
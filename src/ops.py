@@ -16,10 +16,15 @@
 # <pep8 compliant>
 
 from operator import attrgetter
-from time import time
+from time import perf_counter
 
 import bpy
+from bpy_extras.io_utils import ExportHelper, ImportHelper
 
+from . import farm
+from . import plan
+from . import profiles
+from . import teardown
 from . import utils
 from . import wirebomb
 
@@ -29,15 +34,210 @@ class WIREBOMB_OT_set_up(bpy.types.Operator):
     bl_label = "Set Up"
     bl_idname = 'wirebomb.set_up'
 
+    # seconds of setup work done per timer event when run from the UI, the UI stays responsive in between
+    time_budget = 0.05
+    # whether a modal setup is running, only one may run at a time
+    _is_running = False
+
+    @classmethod
+    def poll(cls, context):
+        return not cls._is_running
+
     def execute(self, context):
-        start = time()
-        wirebomb_scene = wirebomb.Wirebomb(context.scene)
-        error_msg = wirebomb_scene.set_up_new()
+        result = wirebomb.set_up(context.scene, context.view_layer, window_manager=context.window_manager)
+        return self.finish(context, result)
+
+    def invoke(self, context, _event):
+        self._start = perf_counter()
+        self._setup = wirebomb.Wirebomb(context.scene, context.view_layer, window_manager=context.window_manager)
+        error_msg = self._setup.error_check()
         if error_msg:
-            self.report({'ERROR'}, error_msg)
+            return self.finish(context, self._setup.get_result(error_msg, 0))
+
+        self._setup.begin_set_up()
+        WIREBOMB_OT_set_up._is_running = True
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.001, window=context.window)
+        wm.modal_handler_add(self)
+        self.show_status(context)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.stop(context)
+            result = self._setup.get_result('', perf_counter() - self._start)
+            if result.scene != context.scene:
+                context.window.scene = result.scene
+            self.report({'WARNING'}, f"Setup cancelled after {len(result.objects)} of "
+                                     f"{len(self._setup.meshes_affected)} objects, Update Existing sets up the "
+                                     f"rest")
+            return {'CANCELLED'}
+
+        if event.type in {'Z', 'Y'} and (event.ctrl or event.oskey):
+            # undo and redo would replace the data the setup is working on
+            return {'RUNNING_MODAL'}
+
+        if event.type != 'TIMER' or event.timer != self._timer:
+            # e.g. navigating the viewport
+            return {'PASS_THROUGH'}
+
+        try:
+            self._setup.set_up_meshes_for(self.time_budget)
+        except ReferenceError:
+            # the user removed data the setup was working on, what was set up can't be recorded reliably
+            self.stop(context, record=False)
+            self.report({'ERROR'}, "Setup aborted, affected data was removed while setting up")
+            return {'CANCELLED'}
+        except Exception:
+            # not leaving the timer and status text behind
+            self.stop(context, record=False)
+            raise
+
+        if not self._setup.is_done:
+            self.show_status(context)
+            return {'RUNNING_MODAL'}
+
+        self.stop(context)
+        return self.finish(context, self._setup.get_result('', perf_counter() - self._start))
+
+    def show_status(self, context):
+        context.workspace.status_text_set(f"Wirebomb: {self._setup.progress} of {len(self._setup.meshes_affected)} "
+                                          f"objects set up, Esc to cancel")
+
+    def cancel(self, context):
+        # called instead of modal when Blender removes the handler, e.g. when a file is loaded or the window closed
+        self.stop(context, record=False)
+
+    def stop(self, context, record=True):
+        """Ends the modal run, keeping what was set up so far."""
+        WIREBOMB_OT_set_up._is_running = False
+        context.window_manager.event_timer_remove(self._timer)
+        if context.workspace:
+            context.workspace.status_text_set(None)
+        if record:
+            self._setup.finish_set_up()
+        else:
+            self._setup.end_progress()
+
+    def finish(self, context, result):
+        if not result.succeeded:
+            self.report({'ERROR'}, result.error_msg)
+            return {'CANCELLED'}
+
+        if result.scene != context.scene:
+            context.window.scene = result.scene
+
+        for warning in result.warnings:
+            self.report({'WARNING'}, warning)
+        self.report({'INFO'}, "Setup done in {} seconds!".format(round(result.seconds, 3)))
+        if result.stats.enabled:
+            self.report({'INFO'}, result.stats.summary())
+        return {'FINISHED'}
+
+
+class WIREBOMB_OT_plan(bpy.types.Operator):
+    """Estimate what setting up would do and cost, without changing anything"""
+    bl_label = "Plan"
+    bl_idname = 'wirebomb.plan'
+
+    def execute(self, context):
+        setup_plan = plan.make_plan(context.scene, context.view_layer)
+        if not setup_plan.succeeded:
+            self.report({'ERROR'}, setup_plan.error_msg)
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, setup_plan.summary())
+        return {'FINISHED'}
+
+
+class WIREBOMB_OT_tear_down(bpy.types.Operator):
+    """Remove everything the setup of this scene created, the scene itself too if the setup copied it"""
+    bl_label = "Tear Down"
+    bl_idname = 'wirebomb.tear_down'
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.wirebomb.record.is_set_up
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_confirm(self, event)
+
+    def execute(self, context):
+        scene = context.scene
+        source_scene = scene.wirebomb.record.source_scene
+        if source_scene:
+            # the scene is about to be removed
+            for window in context.window_manager.windows:
+                if window.scene == scene:
+                    window.scene = source_scene
+
+        result = teardown.tear_down(scene)
+        if not result.succeeded:
+            self.report({'ERROR'}, result.error_msg)
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, result.summary())
+        return {'FINISHED'}
+
+
+class WIREBOMB_OT_load_profile(bpy.types.Operator, ImportHelper):
+    """Load all Wirebomb settings from a profile"""
+    bl_label = "Load Profile"
+    bl_idname = 'wirebomb.load_profile'
+    filename_ext = '.json'
+
+    filter_glob: bpy.props.StringProperty(default='*.json', options={'HIDDEN'})
+
+    def execute(self, context):
+        try:
+            profiles.load_profile(self.filepath).apply(context.scene.wirebomb)
+        except (OSError, profiles.ProfileError) as e:
+            self.report({'ERROR'}, str(e))
             return {'CANCELLED'}
 
-        self.report({'INFO'}, "Setup done in {} seconds!".format(round(time() - start, 3)))
+        return {'FINISHED'}
+
+
+class WIREBOMB_OT_save_profile(bpy.types.Operator, ExportHelper):
+    """Save all Wirebomb settings as a profile, e.g. for batch setups"""
+    bl_label = "Save Profile"
+    bl_idname = 'wirebomb.save_profile'
+    filename_ext = '.json'
+
+    filter_glob: bpy.props.StringProperty(default='*.json', options={'HIDDEN'})
+
+    def execute(self, context):
+        profiles.save_profile(context.scene.wirebomb, self.filepath)
+        return {'FINISHED'}
+
+
+class WIREBOMB_OT_export_farm(bpy.types.Operator, ExportHelper):
+    """Export this scene to a .blend of its own that renders without the add-on, e.g. on a render farm"""
+    bl_label = "Export for Render Farm"
+    bl_idname = 'wirebomb.export_farm'
+    filename_ext = '.blend'
+
+    filter_glob: bpy.props.StringProperty(default='*.blend', options={'HIDDEN'})
+    compress: bpy.props.BoolProperty(name="Compress", description="Write a smaller file, slower to load")
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.wirebomb.record.is_set_up
+
+    def execute(self, context):
+        if bpy.path.abspath(self.filepath) == bpy.data.filepath:
+            self.report({'ERROR'}, "Can't export to the open file")
+            return {'CANCELLED'}
+
+        # the open file is only comparable if it's saved as it is
+        compare_filepath = bpy.data.filepath if not bpy.data.is_dirty else None
+        result = farm.export_for_farm(context.scene, self.filepath, self.compress, compare_filepath)
+        if not result.succeeded:
+            self.report({'ERROR'}, result.error_msg)
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, result.summary())
         return {'FINISHED'}
 
 
@@ -84,18 +284,32 @@ def list_remove_collection(scene, list_prop, collection_index):
         setattr(scene.wirebomb, attr_active_index, active_index - 1)
 
 
-# TODO: Handle warning in API:
-# There is a known bug with using a callback,
-# Python must keep a reference to the strings returned by the callback or Blender will misbehave or even crash.
-def get_collections(_self, context):
-    # according to docs, context may be None
-    if not context:
-        return ()
-    master_coll = context.scene.collection
+# maps scene pointers to the number of collections in the file and the scene's collection enum items.
+# Besides making the search fast, keeping the items keeps references to their strings, which the API requires of
+# enum item callbacks (Blender may misbehave or crash otherwise).
+_collection_items = {}
+
+
+def build_collection_items(scene):
+    master_coll = scene.collection
     scene_collections = utils.get_collection_hierarchy(master_coll)
     next(scene_collections)
     collection_tuples = [(master_coll.name, utils.SCENE_COLL_NAME, '', 'GROUP', 0)]
     collection_tuples.extend([(col.name, col.name, '', 'GROUP', i) for i, col in enumerate(scene_collections, 1)])
+
+    _collection_items[scene.as_pointer()] = len(bpy.data.collections), collection_tuples
+    return collection_tuples
+
+
+def get_collections(_self, context):
+    # according to docs, context may be None
+    if not context:
+        return ()
+
+    # rebuilt when the search is opened (see invoke), or if collections were added or removed since
+    n_collections, collection_tuples = _collection_items.get(context.scene.as_pointer(), (-1, None))
+    if n_collections != len(bpy.data.collections):
+        collection_tuples = build_collection_items(context.scene)
     return collection_tuples
 
 
@@ -109,6 +323,8 @@ class WIREBOMB_OT_add_collection(bpy.types.Operator):
     collection: bpy.props.EnumProperty(items=get_collections)
 
     def invoke(self, context, _event):
+        # the items are only built once per search, not for every key typed
+        build_collection_items(context.scene)
         context.window_manager.invoke_search_popup(self)
         return {'FINISHED'}
 
@@ -131,7 +347,29 @@ class WIREBOMB_OT_remove_collection(bpy.types.Operator):
 
 classes = (
     WIREBOMB_OT_set_up,
+    WIREBOMB_OT_plan,
+    WIREBOMB_OT_tear_down,
+    WIREBOMB_OT_load_profile,
+    WIREBOMB_OT_save_profile,
+    WIREBOMB_OT_export_farm,
     WIREBOMB_OT_add_collection,
     WIREBOMB_OT_remove_collection,
 )
-register, unregister = bpy.utils.register_classes_factory(classes)
+register_classes, unregister_classes = bpy.utils.register_classes_factory(classes)
+
+
+@bpy.app.handlers.persistent
+def reset_set_up(_dummy):
+    # a setup running when another file is loaded is gone, even if Blender didn't cancel it
+    WIREBOMB_OT_set_up._is_running = False
+
+
+def register():
+    register_classes()
+    bpy.app.handlers.load_pre.append(reset_set_up)
+
+
+def unregister():
+    bpy.app.handlers.load_pre.remove(reset_set_up)
+    unregister_classes()
+    _collection_items.clear()
@@ -0,0 +1,206 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+import json
+from collections import defaultdict
+from time import perf_counter
+
+import bpy
+
+from . import geometry
+from . import utils
+from . import wirebomb
+
+# Rough costs of the setup's work, for the estimates of a plan. Recalibrate with benchmarks/set_up_stages.py when the
+# setup changes.
+SECONDS_PER = {
+    'objects': 2e-5,
+    'objects_copied': 3e-4,
+    'meshes_copied': 5e-4,
+    'polygons_copied': 2e-8,
+    'polygons_written': 5e-9,
+    'edges_marked': 3e-9,
+    'material_slots': 2e-5,
+    'modifiers': 1e-4,
+    'drivers': 5e-5,
+    'datablocks': 1e-4,
+}
+# memory of a data block without its geometry
+BYTES_PER_DATABLOCK = 4096
+
+# drivers of a created material: the viewport color and node color channels, and the alpha
+MATERIAL_DRIVERS = 9
+# the extra drivers of the AO factor, and of the wireframe color, alpha and size
+MATERIAL_AO_DRIVERS = 1
+MATERIAL_WIREFRAME_DRIVERS = 5
+# drivers of a created line style: the thickness, color channels and alpha
+LINESTYLE_DRIVERS = 5
+# the line style's drivers of the color channels and alpha, which are moved to the compositor's wireframe nodes
+LINESTYLE_COLOR_DRIVERS = 4
+
+
+class SetUpPlan:
+    """What a setup would do and roughly what it would cost, found without changing anything."""
+
+    def __init__(self, scene, view_layer, error_msg, counts, estimated_seconds, estimated_bytes, seconds):
+        self.scene = scene
+        self.view_layer = view_layer
+        # empty iff the setup would succeed
+        self.error_msg = error_msg
+        # how many of each thing the setup would touch or create, insertion ordered
+        self.counts = counts
+        self.estimated_seconds = estimated_seconds
+        self.estimated_bytes = estimated_bytes
+        # the time the planning itself took
+        self.seconds = seconds
+
+    @property
+    def succeeded(self):
+        return not self.error_msg
+
+    def to_dict(self):
+        return {
+            'scene': self.scene.name,
+            'view_layer': self.view_layer.name,
+            'error': self.error_msg,
+            'counts': dict(self.counts),
+            'estimated_seconds': round(self.estimated_seconds, 3),
+            'estimated_megabytes': round(self.estimated_bytes / 2 ** 20, 1),
+            'planning_seconds': round(self.seconds, 3),
+        }
+
+    def summary(self):
+        """
+        :return: A one-line human readable summary, suitable for an operator report.
+        """
+        counts = ', '.join(f'{name} {value}' for name, value in self.counts.items() if value)
+        return f'~{self.estimated_seconds:.1f}s, ~{self.estimated_bytes / 2 ** 20:.0f} MB | {counts}'
+
+    def write_json(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def make_plan(scene, view_layer=None, settings=None):
+    """
+    Plans a setup without running it, see wirebomb.set_up for the parameters.
+
+    Only reads counts, no mesh data is copied or evaluated, so this takes a fraction of the time of the setup. The
+    counts are upper bounds where the setup may skip work, e.g. reusing a matching material created earlier.
+
+    :return: A SetUpPlan.
+    """
+    start = perf_counter()
+    setup = wirebomb.Wirebomb(scene, view_layer, settings)
+    settings = setup.wirebomb
+    record = setup.record
+    counts = defaultdict(int)
+    estimated_bytes = 0
+
+    error_msg = setup.error_check()
+    is_update = settings.use_incremental and record.is_set_up
+    if is_update:
+        setup.prepare_update()
+
+    mesh_users = setup.mesh_users
+    counts['objects'] = len(setup.meshes_affected)
+    counts['meshes'] = len(mesh_users)
+    counts['polygons'] = sum(len(mesh.polygons) for mesh in mesh_users)
+    counts['edges'] = sum(len(mesh.edges) for mesh in mesh_users)
+
+    shared_meshes = setup.shared_meshes
+    if not is_update and settings.use_new_scene:
+        if settings.use_lean_copy:
+            copied_meshes = setup.find_meshes_changed()
+            counts['objects_copied'] = len(setup.meshes_affected)
+            shared_meshes = set(mesh_users) - copied_meshes
+        else:
+            copied_meshes = {obj.data for obj in scene.objects if obj.type == 'MESH'}
+            counts['objects_copied'] = len(scene.objects)
+        # other object data is copied too, but costs next to nothing
+        counts['meshes_copied'] = len(copied_meshes)
+        counts['polygons_copied'] = sum(len(mesh.polygons) for mesh in copied_meshes)
+        # the scene and the copies
+        counts['datablocks'] += 1 + counts['objects_copied'] + counts['meshes_copied']
+        estimated_bytes += sum(geometry.mesh_bytes(mesh) for mesh in copied_meshes)
+    private_meshes = [mesh for mesh in mesh_users if mesh not in shared_meshes]
+    n_shared_users = sum(len(mesh_users[mesh]) for mesh in shared_meshes)
+
+    def plan_material(name, material_props, record_prop, use_wireframe=False):
+        if material_props.mode == 'EXISTING':
+            return
+        material = getattr(record, record_prop)
+        role = setup.get_material_role(name, use_wireframe)
+        if material and material.get(utils.MATERIAL_ROLE_PROP) == role:
+            return
+        counts['materials'] += 1
+        counts['datablocks'] += 1
+        counts['drivers'] += (MATERIAL_DRIVERS + MATERIAL_AO_DRIVERS * setup.use_shader_ao
+                              + MATERIAL_WIREFRAME_DRIVERS * use_wireframe)
+
+    if settings.use_base:
+        plan_material("Base", settings.material_base, 'material_base', setup.use_shader_wireframe)
+        counts['material_slots'] += len(private_meshes) + n_shared_users
+        counts['polygons_written'] += sum(len(mesh.polygons) for mesh in private_meshes)
+
+    if settings.use_wireframe:
+        method = settings.wireframe_method
+        if method == 'MODIFIER':
+            plan_material("Wireframe", settings.material_wireframe, 'material_wireframe')
+            counts['material_slots'] += len(mesh_users)
+
+            objects = [obj for obj in setup.meshes_affected if not setup.get_recorded_modifier(obj)]
+            estimate = geometry.estimate_wireframe(objects)
+            if settings.use_geometry_budget:
+                over_budget = estimate.find_over_budget(settings.budget_object_faces,
+                                                        settings.budget_memory * 2 ** 20)
+                counts['objects_over_budget'] = int(over_budget.sum())
+                if settings.budget_action == 'SKIP':
+                    estimate = geometry.estimate_wireframe(obj for obj, over in zip(objects, over_budget) if not over)
+            counts['modifiers'] = len(estimate.objects)
+            counts['evaluated_faces'] = int(estimate.faces.sum())
+            if not settings.use_shared_thickness:
+                counts['drivers'] += counts['modifiers']
+            # the evaluated wireframes, held when rendering
+            estimated_bytes += int(estimate.bytes.sum())
+        elif method == 'FREESTYLE':
+            counts['datablocks'] += (not record.wireframe_collection) + (not record.linestyle)
+            if not record.linestyle:
+                counts['drivers'] += LINESTYLE_DRIVERS - LINESTYLE_COLOR_DRIVERS * setup.use_composite_wireframe
+            if setup.use_composite_wireframe and not record.wireframe_node_group:
+                counts['datablocks'] += 1
+                counts['drivers'] += LINESTYLE_COLOR_DRIVERS
+            linestyle = record.linestyle
+            counts['linesets'] = sum(not linestyle or all(line_set.linestyle != linestyle
+                                                          for line_set in v_layer.freestyle_settings.linesets)
+                                     for v_layer in setup.scene.view_layers)
+            counts['edges_marked'] = counts['edges']
+
+    if settings.use_ao:
+        counts['datablocks'] += not record.world
+        if not setup.use_shader_ao and not record.ao_node_group:
+            counts['datablocks'] += 1
+            counts['drivers'] += 1
+
+    estimated_seconds = sum(SECONDS_PER[name] * counts[name] for name in SECONDS_PER)
+    estimated_bytes += counts['datablocks'] * BYTES_PER_DATABLOCK
+
+    return SetUpPlan(setup.scene, setup.view_layer, error_msg or '', counts, estimated_seconds, estimated_bytes,
+                     perf_counter() - start)
+
+
+register, unregister = bpy.utils.register_classes_factory(())
@@ -0,0 +1,249 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+"""
+Setup profiles: complete Wirebomb configurations as JSON, e.g.
+
+    {"wireframe_method": "MODIFIER", "use_ao": true, "material_base": {"color": [1, 1, 1, 1]},
+     "collections_affected": ["Characters"]}
+
+A profile maps setting names to values, or to objects for nested settings. Materials and collections are given by
+name. Settings left out keep their current values.
+"""
+
+import json
+import os
+
+import bpy
+
+from . import utils
+
+# settings that describe a setup rather than configure one, or only exist for the UI
+EXCLUDED_PROPS = {'rna_type', 'name', 'record', 'shared_thickness_modifiers', 'collections_affected_active'}
+
+# maps (absolute path, modification time) to the CompiledProfile of the file
+_cache = {}
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class CompiledProfile:
+    """
+    A validated profile, flattened into a list of assignments that can be applied to any scene's settings in one pass.
+    """
+
+    def __init__(self, assignments):
+        # (attribute path, kind, value) tuples, kind being 'VALUE', 'MATERIAL' or 'COLLECTIONS'
+        self.assignments = assignments
+
+    def write_json(self, filepath):
+        """Saves the validated profile, e.g. for other processes to apply without validating it again."""
+        with open(filepath, 'w') as f:
+            json.dump(self.assignments, f)
+
+    @classmethod
+    def read_json(cls, filepath):
+        """Loads a profile saved by write_json. It was validated when compiled, so it isn't checked again."""
+        with open(filepath) as f:
+            return cls(json.load(f))
+
+    def apply(self, settings):
+        """
+        Applies the profile to Wirebomb settings.
+
+        :param settings: The settings, e.g. scene.wirebomb.
+        :raise ProfileError: If a material or collection the profile names doesn't exist.
+        """
+        scene = settings.id_data
+        for path, kind, value in self.assignments:
+            data = settings
+            for name in path[:-1]:
+                data = getattr(data, name)
+
+            if kind == 'MATERIAL':
+                material = bpy.data.materials.get(value) if value else None
+                if value and not material:
+                    raise ProfileError(f"No material named '{value}'")
+                setattr(data, path[-1], material)
+            elif kind == 'COLLECTIONS':
+                apply_collections(scene, getattr(data, path[-1]), value)
+            else:
+                setattr(data, path[-1], value)
+
+
+def apply_collections(scene, items, names):
+    collections = []
+    for name in names:
+        collection = scene.collection if name == utils.SCENE_COLL_NAME else utils.collection_from_name(scene, name)
+        if not collection:
+            raise ProfileError(f"No collection named '{name}'")
+        collections.append(collection)
+
+    items.clear()
+    for collection in collections:
+        item = items.add()
+        item.value = collection
+        # FIXME: See FIXME in ui.py
+        if collection == scene.collection:
+            item.name = collection.name
+
+
+def compile_profile(profile, rna=None, path=()):
+    """
+    Validates a profile against the settings' definitions and flattens it.
+
+    :param profile: The profile, as loaded from JSON.
+    :param rna: The definition of the settings the profile is for, defaults to the Wirebomb settings.
+    :param path: The attribute path of the settings, for nested settings.
+    :return: A CompiledProfile.
+    :raise ProfileError: If the profile has unknown settings or invalid values.
+    """
+    rna = rna or bpy.types.WirebombData.bl_rna
+    if not isinstance(profile, dict):
+        raise ProfileError(f"'{'.'.join(path) or 'profile'}' must be an object")
+
+    assignments = []
+    for name, value in profile.items():
+        prop = rna.properties.get(name)
+        prop_path = path + (name,)
+        if prop is None or name in EXCLUDED_PROPS:
+            raise ProfileError(f"Unknown setting '{'.'.join(prop_path)}'")
+
+        if is_property_group(prop):
+            assignments.extend(compile_profile(value, prop.fixed_type, prop_path).assignments)
+        elif prop.type == 'POINTER' and prop.fixed_type.identifier == 'Material':
+            check(value is None or isinstance(value, str), prop_path, "a material name or null")
+            assignments.append((prop_path, 'MATERIAL', value))
+        elif prop.type == 'COLLECTION' and name == 'collections_affected':
+            check(isinstance(value, list) and all(isinstance(item, str) for item in value), prop_path,
+                  "a list of collection names")
+            assignments.append((prop_path, 'COLLECTIONS', value))
+        else:
+            assignments.append((prop_path, 'VALUE', compile_value(prop, value, prop_path)))
+
+    return CompiledProfile(assignments)
+
+
+def is_property_group(prop):
+    """
+    :return: Whether a property holds nested settings.
+    """
+    if prop.type != 'POINTER':
+        return False
+    base = prop.fixed_type.base
+    return base is not None and base.identifier == 'PropertyGroup'
+
+
+def compile_value(prop, value, path):
+    """
+    :return: The value to assign to a property, checked against the property's type, length, range and items.
+    """
+    if prop.type == 'ENUM':
+        check(value in {item.identifier for item in prop.enum_items}, path,
+              "one of " + ', '.join(item.identifier for item in prop.enum_items))
+        return value
+
+    if prop.type == 'STRING':
+        check(isinstance(value, str), path, "a string")
+        return value
+
+    if prop.type not in {'BOOLEAN', 'INT', 'FLOAT'}:
+        raise ProfileError(f"Setting '{'.'.join(path)}' can't be set by profiles")
+
+    # bool is a subclass of int, so it's told apart explicitly
+    if prop.type == 'BOOLEAN':
+        is_valid = lambda x: isinstance(x, bool)  # noqa: E731
+    elif prop.type == 'INT':
+        is_valid = lambda x: isinstance(x, int) and not isinstance(x, bool)  # noqa: E731
+    else:
+        is_valid = lambda x: isinstance(x, (int, float)) and not isinstance(x, bool)  # noqa: E731
+
+    length = prop.array_length
+    values = value if length else [value]
+    check(isinstance(values, list) and len(values) == max(1, length) and all(map(is_valid, values)), path,
+          f"{length} {prop.type.lower()} values" if length else f"a {prop.type.lower()} value")
+    if prop.type != 'BOOLEAN':
+        check(all(prop.hard_min <= x <= prop.hard_max for x in values), path,
+              f"within [{prop.hard_min}, {prop.hard_max}]")
+
+    return tuple(values) if length else value
+
+
+def check(condition, path, expected):
+    if not condition:
+        raise ProfileError(f"Setting '{'.'.join(path)}' must be {expected}")
+
+
+def load_profile(filepath):
+    """
+    Loads and compiles a profile file, or gets it from the cache if the file hasn't changed since.
+
+    :return: A CompiledProfile.
+    :raise ProfileError: If the profile is invalid.
+    """
+    filepath = os.path.abspath(filepath)
+    key = filepath, os.path.getmtime(filepath)
+    compiled = _cache.get(key)
+    if compiled is None:
+        with open(filepath) as f:
+            try:
+                profile = json.load(f)
+            except ValueError as e:
+                raise ProfileError(f"Invalid JSON: {e}")
+        compiled = _cache[key] = compile_profile(profile)
+
+    return compiled
+
+
+def make_profile(settings, rna=None):
+    """
+    Makes a complete profile of the current settings, the inverse of applying a profile.
+
+    :param settings: The settings, e.g. scene.wirebomb.
+    :return: The profile, ready to be saved as JSON.
+    """
+    rna = rna or settings.bl_rna
+    profile = {}
+    for prop in rna.properties:
+        name = prop.identifier
+        if name in EXCLUDED_PROPS:
+            continue
+
+        value = getattr(settings, name)
+        if prop.type == 'POINTER' and prop.fixed_type.identifier == 'Material':
+            profile[name] = value.name if value else None
+        elif is_property_group(prop):
+            profile[name] = make_profile(value, prop.fixed_type)
+        elif prop.type == 'COLLECTION' and name == 'collections_affected':
+            profile[name] = [utils.SCENE_COLL_NAME if item.value == settings.id_data.collection else item.value.name
+                             for item in value if item.value]
+        elif prop.type in {'BOOLEAN', 'INT', 'FLOAT'} and prop.array_length:
+            profile[name] = list(value)
+        elif prop.type in {'BOOLEAN', 'INT', 'FLOAT', 'ENUM', 'STRING'}:
+            profile[name] = value
+
+    return profile
+
+
+def save_profile(settings, filepath):
+    with open(filepath, 'w') as f:
+        json.dump(make_profile(settings), f, indent=2)
+
+
+register, unregister = bpy.utils.register_classes_factory(())
@@ -15,6 +15,8 @@
 
 # <pep8 compliant>
 
+import math
+
 import bpy
 
 
@@ -50,6 +52,71 @@ class CollectionItem(bpy.types.PropertyGroup):
     value: bpy.props.PointerProperty(type=bpy.types.Collection)
 
 
+class ModifierItem(bpy.types.PropertyGroup):
+    """A modifier created by the add-on, `name` holds the modifier's name."""
+    object: bpy.props.PointerProperty(type=bpy.types.Object)
+
+
+class RecordedObject(bpy.types.PropertyGroup):
+    """An object processed by a setup, with what it looked like afterwards."""
+    object: bpy.props.PointerProperty(type=bpy.types.Object)
+    mesh: bpy.props.PointerProperty(type=bpy.types.Mesh)
+    # geometry and material counts of the mesh, see SetUpRecord.signature
+    signature: bpy.props.StringProperty()
+    # name of the wireframe modifier added to the object, if any
+    modifier: bpy.props.StringProperty()
+
+
+class RecordedLineSet(bpy.types.PropertyGroup):
+    """A line set of the user's that a setup stopped rendering, `name` holds the line set's name."""
+    view_layer: bpy.props.StringProperty()
+
+
+class SetUpRecord(bpy.types.PropertyGroup):
+    """What a setup of the scene created and touched, so that it can be updated instead of rebuilt."""
+    is_set_up: bpy.props.BoolProperty()
+    # the scene this one was copied from by the setup, None if the setup was made in place
+    source_scene: bpy.props.PointerProperty(type=bpy.types.Scene)
+    material_base: bpy.props.PointerProperty(type=bpy.types.Material)
+    material_wireframe: bpy.props.PointerProperty(type=bpy.types.Material)
+    wireframe_collection: bpy.props.PointerProperty(type=bpy.types.Collection)
+    linestyle: bpy.props.PointerProperty(type=bpy.types.FreestyleLineStyle)
+    world: bpy.props.PointerProperty(type=bpy.types.World)
+    # the world the scene had before the setup
+    original_world: bpy.props.PointerProperty(type=bpy.types.World)
+    ao_node_group: bpy.props.PointerProperty(type=bpy.types.NodeTree)
+    wireframe_node_group: bpy.props.PointerProperty(type=bpy.types.NodeTree)
+    objects: bpy.props.CollectionProperty(type=RecordedObject)
+    disabled_line_sets: bpy.props.CollectionProperty(type=RecordedLineSet)
+    # the settings the objects were set up with, see Wirebomb.get_settings_fingerprint
+    settings_fingerprint: bpy.props.StringProperty()
+
+    @staticmethod
+    def signature(mesh):
+        return f'{len(mesh.vertices)} {len(mesh.edges)} {len(mesh.polygons)} {len(mesh.materials)}'
+
+    def clear(self):
+        self.is_set_up = False
+        self.source_scene = None
+        self.material_base = self.material_wireframe = None
+        self.wireframe_collection = None
+        self.linestyle = None
+        self.world = self.original_world = None
+        self.ao_node_group = self.wireframe_node_group = None
+        self.objects.clear()
+        self.disabled_line_sets.clear()
+        self.settings_fingerprint = ''
+
+
+def update_thickness_modifier(self, _context):
+    """Propagates the thickness to the wireframe modifiers set up without drivers."""
+    for item in self.shared_thickness_modifiers:
+        if item.object:
+            modifier = item.object.modifiers.get(item.name)
+            if modifier:
+                modifier.thickness = self.thickness_modifier
+
+
 class WirebombData(bpy.types.PropertyGroup):
     """Stores add-on data."""
     use_clear_materials: bpy.props.BoolProperty(
@@ -64,12 +131,36 @@ class WirebombData(bpy.types.PropertyGroup):
         description="Use basic ambient occlusion lighting setup",
         options=set()
     )
+    ao_method: bpy.props.EnumProperty(
+        items=[('COMPOSITOR', 'Compositor', 'Multiply the render by an AO render pass in the compositor'),
+               ('SHADER', 'Shader', 'Multiply the color of the generated materials by AO, which needs no extra '
+                                    'render pass or compositing (existing materials get no AO)')],
+        name='AO Method',
+        description="How the ambient occlusion is applied",
+        default='COMPOSITOR',
+        options=set()
+    )
+    ao_factor: bpy.props.FloatProperty(
+        name='AO Factor',
+        subtype='FACTOR',
+        min=0,
+        max=1,
+        default=0.73,
+        description="Strength of the ambient occlusion (updates real-time)"
+    )
     use_new_scene: bpy.props.BoolProperty(
         name='New Scene',
         default=True,
         description="Preserve the current scene by operating on a copy of it",
         options=set()
     )
+    use_lean_copy: bpy.props.BoolProperty(
+        name='Share Unaffected Data',
+        default=False,
+        description="Only copy the affected objects, and only the meshes that the setup has to change. Everything else "
+                    "is shared with the current scene, which saves memory on big scenes",
+        options=set()
+    )
     new_scene_name: bpy.props.StringProperty(
         name='Name',
         default='Wireframe',
@@ -120,12 +211,39 @@ class WirebombData(bpy.types.PropertyGroup):
     )
     wireframe_method: bpy.props.EnumProperty(
         items=[('FREESTYLE', 'Freestyle', 'Create wireframe using freestyle'),
-               ('MODIFIER', 'Modifier', 'Create wireframe using the wireframe modifier')],
+               ('MODIFIER', 'Modifier', 'Create wireframe using the wireframe modifier'),
+               ('SHADER', 'Shader', 'Draw the wireframe in the base material, adds no geometry. Shows the edges '
+                                    'of the triangles the faces are rendered as')],
         name='Method',
         description='The method used to create the wireframe effect',
         default='FREESTYLE',
         options=set()
     )
+    use_feature_edges: bpy.props.BoolProperty(
+        name='Feature Edges Only',
+        default=False,
+        description="Only draw the edges that outline the shape: boundary, seam and sharp edges, and edges whose "
+                    "faces meet at an angle of at least Feature Angle. Leaves out e.g. the diagonals of flat "
+                    "triangulated surfaces, which also makes Freestyle render faster",
+        options=set()
+    )
+    feature_angle: bpy.props.FloatProperty(
+        name='Feature Angle',
+        subtype='ANGLE',
+        min=0,
+        max=math.pi,
+        default=math.radians(30),
+        description="The minimum angle between two faces for the edge between them to be drawn",
+        options=set()
+    )
+    use_composite_wireframe: bpy.props.BoolProperty(
+        name='Composite Wireframe',
+        default=False,
+        description="Render the lines to a separate pass and draw them over the image in the compositor, so that "
+                    "changing the wireframe color only needs re-compositing. Combined with the Compositor AO "
+                    "method, the AO factor can be changed the same way",
+        options=set()
+    )
     thickness_freestyle: bpy.props.FloatProperty(
         name='Thickness',
         subtype='NONE',
@@ -136,6 +254,16 @@ class WirebombData(bpy.types.PropertyGroup):
         default=1,
         description="Wireframe thickness (updates real-time)"
     )
+    thickness_shader: bpy.props.FloatProperty(
+        name='Thickness',
+        subtype='DISTANCE',
+        precision=4,
+        step=0.01,
+        min=0,
+        soft_max=1,
+        default=0.01,
+        description="Wireframe thickness (updates real-time)"
+    )
     thickness_modifier: bpy.props.FloatProperty(
         name='Thickness',
         subtype='NONE',
@@ -144,16 +272,85 @@ class WirebombData(bpy.types.PropertyGroup):
         soft_min=0,
         soft_max=1,
         default=0.008,
-        description="Wireframe thickness (updates real-time)"
+        description="Wireframe thickness (updates real-time)",
+        update=update_thickness_modifier
+    )
+    use_shared_thickness: bpy.props.BoolProperty(
+        name='Shared Thickness',
+        default=False,
+        description="Update the thickness of all wireframe modifiers from this setting directly instead of through one "
+                    "driver per object, which keeps the viewport responsive with many objects. The thickness then "
+                    "doesn't follow keyframes",
+        options=set()
+    )
+    # wireframe modifiers whose thickness is set by update_thickness_modifier
+    shared_thickness_modifiers: bpy.props.CollectionProperty(type=ModifierItem)
+    use_geometry_budget: bpy.props.BoolProperty(
+        name='Geometry Budget',
+        default=False,
+        description="Estimate the geometry the wireframe modifiers will generate before adding them, and check it "
+                    "against a budget",
+        options=set()
+    )
+    budget_action: bpy.props.EnumProperty(
+        items=[('WARN', 'Warn', 'Add the modifiers anyway, and report the objects over the budget'),
+               ('SKIP', 'Skip', 'Leave out the modifiers of the objects over the budget, the largest first')],
+        name='Over Budget',
+        description='What to do when objects are over the geometry budget',
+        default='WARN',
+        options=set()
+    )
+    budget_object_faces: bpy.props.IntProperty(
+        name='Faces per Object',
+        min=0,
+        default=5_000_000,
+        description="The maximum number of faces of any one object with its wireframe, 0 for no limit",
+        options=set()
+    )
+    budget_memory: bpy.props.IntProperty(
+        name='Total Memory (MB)',
+        min=0,
+        default=4096,
+        description="The maximum estimated memory of all affected objects with their wireframes, 0 for no limit",
+        options=set()
     )
     material_wireframe: bpy.props.PointerProperty(type=MaterialWireframeData)
     material_base: bpy.props.PointerProperty(type=MaterialBaseData)
 
+    use_incremental: bpy.props.BoolProperty(
+        name='Update Existing',
+        default=True,
+        description="If this scene has already been set up, update that setup instead of building a new one: only "
+                    "new or changed objects are processed, or all objects if settings other than colors and "
+                    "thicknesses changed, and the existing materials, collection, line style and compositor nodes "
+                    "are reused",
+        options=set()
+    )
+    record: bpy.props.PointerProperty(type=SetUpRecord)
+
+    use_stats: bpy.props.BoolProperty(
+        name='Statistics',
+        default=False,
+        description="Record the time of every setup stage and counts of the data touched",
+        options=set()
+    )
+    stats_path: bpy.props.StringProperty(
+        name='Log File',
+        subtype='FILE_PATH',
+        default='',
+        description="JSON file to write the statistics to, leave empty to only report them",
+        options=set()
+    )
+
 
 classes = (
     MaterialWireframeData,
     MaterialBaseData,
     CollectionItem,
+    ModifierItem,
+    RecordedObject,
+    RecordedLineSet,
+    SetUpRecord,
     WirebombData,
 )
 register_classes, unregister_classes = bpy.utils.register_classes_factory(classes)
@@ -0,0 +1,188 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+import bpy
+
+# maps (scene pointer, view layer name, settings key) to AffectedMeshes, cleared on relevant depsgraph updates, undo
+# and redo
+_cache = {}
+# the numbers of objects and collections in the file when the cache was last used, it's cleared if they changed
+_data_counts = None
+
+
+class AffectedMeshes:
+    """The mesh objects a setup would affect, with counts for the UI."""
+
+    def __init__(self, objects, selection=None):
+        self.objects = objects
+        self.meshes = {obj.data for obj in objects}
+        # the selected objects they were found from, None if the selection doesn't matter
+        self.selection = selection
+        self._faces = None
+
+    @property
+    def faces(self):
+        # only counted when asked for, i.e. when the UI shows it
+        if self._faces is None:
+            self._faces = sum(len(mesh.polygons) for mesh in self.meshes)
+        return self._faces
+
+
+def get_collection_meshes(collections):
+    """
+    Finds all mesh objects in the given collections and their children.
+
+    Each collection is only visited once, however many of the given collections it's nested under.
+
+    :param collections: The collections to search, None entries are skipped.
+    :return: A set of the mesh objects.
+    """
+    meshes = set()
+    visited = set()
+    stack = [coll for coll in collections if coll is not None]
+
+    while stack:
+        coll = stack.pop()
+        if coll in visited:
+            continue
+        visited.add(coll)
+
+        meshes.update(obj for obj in coll.objects if obj.type == 'MESH')
+        stack.extend(coll.children)
+
+    return meshes
+
+
+def resolve(scene, view_layer, settings):
+    """
+    Finds the mesh objects affected by the mesh selection settings.
+
+    :param scene: The scene to search.
+    :param view_layer: The view layer whose selection to use.
+    :param settings: The Wirebomb settings to use.
+    :return: A set of the affected mesh objects.
+    """
+    if settings.affect_mode == 'EXCLUSIVE':
+        meshes_affected = {obj for obj in scene.objects if obj.type == 'MESH'}
+        update_meshes_affected = meshes_affected.difference_update
+    else:
+        meshes_affected = set()
+        update_meshes_affected = meshes_affected.update
+
+    if settings.use_affect_selected:
+        # reading the selection through the view layer, works without a 3D view (or any window)
+        update_meshes_affected(obj for obj in view_layer.objects.selected if obj.type == 'MESH')
+    if settings.use_affect_collections:
+        update_meshes_affected(get_collection_meshes(item.value for item in settings.collections_affected))
+
+    return meshes_affected
+
+
+def get_affected(scene, view_layer, settings=None):
+    """
+    Cached variant of resolve, for cheap repeated use in the UI. The cache is cleared when objects or collections are
+    added, removed or changed, when meshes change, and on undo and redo. Results depending on the selection are
+    dropped when it changes.
+
+    :return: An AffectedMeshes.
+    """
+    global _data_counts
+    data_counts = len(bpy.data.objects), len(bpy.data.collections)
+    if data_counts != _data_counts:
+        _cache.clear()
+        _data_counts = data_counts
+
+    settings = settings or scene.wirebomb
+    settings_key = (settings.affect_mode, settings.use_affect_selected, settings.use_affect_collections,
+                    tuple(item.value.name if item.value else '' for item in settings.collections_affected))
+    key = scene.as_pointer(), view_layer.name, settings_key
+
+    affected = _cache.get(key)
+    if affected is None:
+        selection = get_selection(view_layer) if settings.use_affect_selected else None
+        affected = _cache[key] = AffectedMeshes(resolve(scene, view_layer, settings), selection)
+
+    return affected
+
+
+def get_selection(view_layer):
+    return frozenset(view_layer.objects.selected)
+
+
+@bpy.app.handlers.persistent
+def invalidate_cache(_scene, depsgraph):
+    if not _cache:
+        return
+
+    is_scene_updated = False
+    for update in depsgraph.updates:
+        id_data = update.id
+        if isinstance(id_data, bpy.types.Object):
+            # moving objects around doesn't change what is affected
+            if update.is_updated_geometry or not update.is_updated_transform:
+                break
+        elif isinstance(id_data, bpy.types.Collection) or update.is_updated_geometry:
+            # also where objects are added or removed
+            break
+        elif isinstance(id_data, bpy.types.Scene):
+            # e.g. a setting was changed, or the selection
+            is_scene_updated = True
+    else:
+        if is_scene_updated:
+            drop_selection_changed(depsgraph.scene, depsgraph.view_layer)
+        return
+
+    _cache.clear()
+
+
+def drop_selection_changed(scene, view_layer):
+    """Drops the cached results of a view layer that depend on its selection, if it changed."""
+    scene_pointer = scene.as_pointer()
+    selection = None
+    for key, affected in list(_cache.items()):
+        if key[0] != scene_pointer or key[1] != view_layer.name or affected.selection is None:
+            continue
+        if selection is None:
+            selection = get_selection(view_layer)
+        if affected.selection != selection:
+            del _cache[key]
+
+
+@bpy.app.handlers.persistent
+def clear_cache(_dummy):
+    _cache.clear()
+
+
+# the cached objects are invalid after these
+cache_clear_handlers = (
+    bpy.app.handlers.load_post,
+    bpy.app.handlers.undo_post,
+    bpy.app.handlers.redo_post,
+)
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_cache)
+    for handlers in cache_clear_handlers:
+        handlers.append(clear_cache)
+
+
+def unregister():
+    for handlers in cache_clear_handlers:
+        handlers.remove(clear_cache)
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_cache)
+    _cache.clear()
@@ -0,0 +1,87 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+import bpy
+
+
+class SetUpStats:
+    """Collects the wall time of every setup stage and counters of the work done."""
+    enabled = True
+
+    def __init__(self):
+        # insertion ordered, i.e. in the order the stages ran
+        self.stages = {}
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + perf_counter() - start
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def to_dict(self):
+        return {
+            'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def summary(self):
+        """
+        :return: A one-line human readable summary, suitable for an operator report.
+        """
+        stages = ', '.join(f'{name} {seconds:.3f}s' for name, seconds in self.stages.items())
+        counters = ', '.join(f'{name} {value}' for name, value in self.counters.items())
+        return f'{stages} | {counters}'
+
+    def write_json(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class NullStats:
+    """Stand-in for SetUpStats when statistics are off, does nothing as cheaply as possible."""
+    enabled = False
+
+    class _NullStage:
+        def __enter__(self):
+            pass
+
+        def __exit__(self, *_args):
+            pass
+
+    _null_stage = _NullStage()
+
+    def stage(self, _name):
+        return self._null_stage
+
+    def count(self, _name, _value=1):
+        pass
+
+
+NULL_STATS = NullStats()
+
+register, unregister = bpy.utils.register_classes_factory(())
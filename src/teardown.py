@@ -0,0 +1,238 @@
+#  Copyright (C) 2020  Gustaf Blomqvist
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# <pep8 compliant>
+
+from collections import Counter
+from itertools import chain
+from time import perf_counter
+
+import bpy
+
+from . import geometry
+from . import plan
+from . import utils
+
+
+class TearDownResult:
+    """What a teardown removed."""
+
+    def __init__(self, scene_name, error_msg, datablocks, changes, reclaimed_bytes, seconds):
+        self.scene_name = scene_name
+        # empty iff the teardown succeeded
+        self.error_msg = error_msg
+        # how many data blocks of each type were removed
+        self.datablocks = datablocks
+        # how many modifiers, material slots etc. were removed from the data that was kept
+        self.changes = changes
+        # a rough estimate, like the ones of plans
+        self.reclaimed_bytes = reclaimed_bytes
+        self.seconds = seconds
+
+    @property
+    def succeeded(self):
+        return not self.error_msg
+
+    def to_dict(self):
+        return {
+            'scene': self.scene_name,
+            'error': self.error_msg,
+            'datablocks': dict(self.datablocks),
+            'changes': dict(self.changes),
+            'reclaimed_megabytes': round(self.reclaimed_bytes / 2 ** 20, 1),
+            'seconds': round(self.seconds, 3),
+        }
+
+    def summary(self):
+        """
+        :return: A one-line human readable summary, suitable for an operator report.
+        """
+        removed = ', '.join(f'{name} {value}' for name, value in chain(self.datablocks.items(), self.changes.items()))
+        return (f'Removed {sum(self.datablocks.values())} data blocks, ~{self.reclaimed_bytes / 2 ** 20:.1f} MB '
+                f'reclaimed | {removed}')
+
+
+def tear_down(scene, settings=None):
+    """
+    Removes what the recorded setup of a scene created.
+
+    If the setup copied the scene, the copy is removed along with the objects, object data and collections only it
+    used. Else, the setup's modifiers, material slots, Freestyle edge marks, line sets and compositor nodes are removed
+    from the scene, and its original world is restored. Either way, the materials, world, node groups, line style and
+    collection the setup created are then removed, unless something else uses them.
+
+    The Freestyle edge marks and line sets the scene had before are restored. Materials cleared by the setup, and
+    render settings it switched on, are not restored.
+
+    :param scene: The set up scene. Make sure no window shows it if it's a copy, since it will be removed.
+    :param settings: The Wirebomb settings holding the record of the setup, defaults to the scene's own.
+    :return: A TearDownResult.
+    """
+    start = perf_counter()
+    settings = settings or scene.wirebomb
+    record = settings.record
+    scene_name = scene.name
+    if not record.is_set_up:
+        return TearDownResult(scene_name, "The scene isn't set up", Counter(), Counter(), 0, perf_counter() - start)
+
+    created = find_created(record)
+
+    # the memory of the generated wireframes, read before their modifiers are removed
+    modified = [item.object for item in record.objects
+                if item.object and item.modifier and item.modifier in item.object.modifiers]
+    reclaimed_bytes = int(geometry.estimate_wireframe(modified).bytes.sum())
+
+    if record.source_scene:
+        # the record's pointers are users of the data too, which would keep e.g. the copied meshes from being removed
+        record.clear()
+        settings.shared_thickness_modifiers.clear()
+        removed = find_scene_data(scene)
+        changes = Counter()
+    else:
+        removed = []
+        changes = undo_in_place(scene, settings, created)
+        record.clear()
+        settings.shared_thickness_modifiers.clear()
+
+    reclaimed_bytes += sum(geometry.mesh_bytes(id_data) for id_data in removed if isinstance(id_data, bpy.types.Mesh))
+    datablocks = Counter(type(id_data).__name__ for id_data in removed)
+    bpy.data.batch_remove(removed)
+
+    # unused now, unless e.g. another setup reuses them
+    created = [id_data for id_data in created if id_data.users == 0]
+    # the templates of the materials, rebuilt when needed
+    created.extend(material for material in bpy.data.materials
+                   if material.name.startswith(utils.MATERIAL_TEMPLATE_NAME))
+    datablocks.update(type(id_data).__name__ for id_data in created)
+    bpy.data.batch_remove(created)
+
+    reclaimed_bytes += plan.BYTES_PER_DATABLOCK * sum(datablocks.values())
+    return TearDownResult(scene_name, '', datablocks, changes, reclaimed_bytes, perf_counter() - start)
+
+
+def find_created(record):
+    """
+    :return: A list of the data blocks a recorded setup created.
+    """
+    created = [record.material_base, record.material_wireframe, record.world, record.ao_node_group,
+               record.wireframe_node_group, record.linestyle, record.wireframe_collection]
+    # the materials in the record may have been picked by the user
+    return [id_data for id_data in created
+            if id_data and (not isinstance(id_data, bpy.types.Material) or utils.MATERIAL_ROLE_PROP in id_data)]
+
+
+def find_scene_data(scene):
+    """
+    Finds a scene and the objects, object data and collections no other scene uses.
+
+    :return: A list of the data blocks.
+    """
+    other_objects = set()
+    other_collections = set()
+    for other_scene in bpy.data.scenes:
+        if other_scene != scene:
+            other_objects.update(other_scene.objects)
+            other_collections.update(utils.get_collection_hierarchy(other_scene.collection))
+
+    objects = [obj for obj in scene.objects if obj not in other_objects]
+    collections = [coll for coll in utils.get_collection_hierarchy(scene.collection)
+                   if coll != scene.collection and coll not in other_collections]
+    # object data only used by the removed objects
+    data_users = Counter(obj.data for obj in objects if obj.data is not None)
+    data = [data for data, n_users in data_users.items() if data.users == n_users]
+
+    return [scene] + objects + collections + data
+
+
+def undo_in_place(scene, settings, created):
+    """
+    Removes the changes a setup made to the objects and settings of a scene, leaving it as if it wasn't set up.
+
+    :param created: The data blocks the setup created.
+    :return: A Counter of the modifiers, material slots, edge marks, line sets and nodes removed, and of the line sets
+    restored.
+    """
+    counts = Counter()
+    record = settings.record
+    created = set(created)
+
+    meshes = set()
+    for item in record.objects:
+        obj = item.object
+        if not obj:
+            continue
+
+        modifier = obj.modifiers.get(item.modifier) if item.modifier else None
+        if modifier:
+            obj.modifiers.remove(modifier)
+            counts['modifiers'] += 1
+
+        for slot in obj.material_slots:
+            if slot.link == 'OBJECT' and slot.material in created:
+                slot.material = None
+                slot.link = 'DATA'
+                counts['material_slots'] += 1
+
+        if item.mesh:
+            meshes.add(item.mesh)
+
+    for mesh in meshes:
+        # popping from the back so that the remaining indexes stay valid, the faces' indexes are shifted by Blender
+        for i in reversed(range(len(mesh.materials))):
+            if mesh.materials[i] in created:
+                mesh.materials.pop(index=i)
+                counts['material_slots'] += 1
+
+    if record.wireframe_collection:
+        for mesh in meshes:
+            utils.restore_freestyle_marks(mesh)
+            counts['edges_unmarked'] += len(mesh.edges)
+
+    if record.linestyle:
+        for v_layer in scene.view_layers:
+            line_sets = v_layer.freestyle_settings.linesets
+            for line_set in [line_set for line_set in line_sets if line_set.linestyle == record.linestyle]:
+                line_sets.remove(line_set)
+                counts['linesets'] += 1
+
+    # rendering the user's line sets again
+    for item in record.disabled_line_sets:
+        v_layer = scene.view_layers.get(item.view_layer)
+        line_set = v_layer.freestyle_settings.linesets.get(item.name) if v_layer else None
+        if line_set:
+            line_set.show_render = True
+            counts['linesets_restored'] += 1
+    record.disabled_line_sets.clear()
+
+    tree = scene.node_tree
+    group_trees = {group_tree for group_tree in (record.ao_node_group, record.wireframe_node_group) if group_tree}
+    if group_trees and tree:
+        for node in [node for node in tree.nodes if node.type == 'GROUP' and node.node_tree in group_trees]:
+            # linking the images the group changed straight to where the group's outputs went
+            for output in node.outputs:
+                image_input = node.inputs.get(output.name)
+                if image_input and image_input.links:
+                    for link in output.links:
+                        tree.links.new(image_input.links[0].from_socket, link.to_socket)
+            tree.nodes.remove(node)
+            counts['nodes'] += 1
+
+    if record.world and scene.world == record.world:
+        scene.world = record.original_world
+
+    return counts
+
+
+register, unregister = bpy.utils.register_classes_factory(())
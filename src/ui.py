@@ -18,6 +18,7 @@
 import bpy
 
 from . import ops
+from . import selection
 from . import ui_presets
 from . import utils
 
@@ -33,13 +34,38 @@ def update_list_collection(scene, list_prop):
 
         indexes_of_removed = [i for i, collection in enumerate(collections) if collection.value is None]
 
-        for i in indexes_of_removed:
+        # removing from the back, so that the remaining indexes stay valid
+        for i in reversed(indexes_of_removed):
             ops.list_remove_collection(scene, list_prop, i)
 
 
+def update_lists_affected():
+    for scene in bpy.data.scenes:
+        update_list_collection(scene, 'collections_affected')
+
+
 @bpy.app.handlers.persistent
-def update_list_affected(scene):
-    update_list_collection(scene, 'collections_affected')
+def update_lists_on_event(*_args):
+    """Validates the lists when they may hold removed collections without the UI having drawn them yet."""
+    update_lists_affected()
+
+
+# whether a list update is already scheduled
+_is_update_pending = False
+
+
+def request_lists_update():
+    """Schedules validation of the lists, however many times this is called before it runs, it only runs once."""
+    global _is_update_pending
+    if not _is_update_pending:
+        _is_update_pending = True
+        bpy.app.timers.register(_run_lists_update, first_interval=0)
+
+
+def _run_lists_update():
+    global _is_update_pending
+    _is_update_pending = False
+    update_lists_affected()
 
 
 class WIREBOMB_UL_collections(bpy.types.UIList):
@@ -49,12 +75,8 @@ class WIREBOMB_UL_collections(bpy.types.UIList):
             text = item.value.name if item.value != context.scene.collection else utils.SCENE_COLL_NAME
             layout.label(text=text, icon='GROUP')
         else:
-            # this should only happen if someone has removed the list's app handler
-            bpy.app.timers.register(lambda: update_list_affected(context.scene), first_interval=0)
-
-            if update_list_affected not in bpy.app.handlers.depsgraph_update_pre:
-                bpy.app.handlers.depsgraph_update_pre.append(update_list_affected)
-
+            # the collection was removed since the list was last validated
+            request_lists_update()
             layout.label(text='...')
 
 
@@ -74,11 +96,27 @@ class WIREBOMB_PT_main(bpy.types.Panel):
         layout = self.layout
         layout.use_property_split = True
 
-        layout.operator(operator=ops.WIREBOMB_OT_set_up.bl_idname, icon='SHADING_WIRE')
+        row = layout.row(align=True)
+        row.operator(operator=ops.WIREBOMB_OT_set_up.bl_idname, icon='SHADING_WIRE')
+        row.operator(operator=ops.WIREBOMB_OT_plan.bl_idname, text='', icon='INFO')
+        if wirebomb.record.is_set_up:
+            row.operator(operator=ops.WIREBOMB_OT_export_farm.bl_idname, text='', icon='EXPORT')
+            row.operator(operator=ops.WIREBOMB_OT_tear_down.bl_idname, text='', icon='TRASH')
+
+        row = layout.row(align=True)
+        row.operator(operator=ops.WIREBOMB_OT_load_profile.bl_idname, icon='FILE_FOLDER')
+        row.operator(operator=ops.WIREBOMB_OT_save_profile.bl_idname, icon='FILE_TICK')
 
         grid = layout.grid_flow()
         grid.prop(wirebomb, property='use_ao')
         grid.prop(wirebomb, property='use_clear_materials')
+        if wirebomb.record.is_set_up:
+            grid.prop(wirebomb, property='use_incremental')
+
+        if wirebomb.use_ao:
+            col = layout.column()
+            col.prop(wirebomb, property='ao_method')
+            col.prop(wirebomb, property='ao_factor')
 
 
 class WIREBOMB_PT_new_scene(bpy.types.Panel):
@@ -100,6 +138,7 @@ class WIREBOMB_PT_new_scene(bpy.types.Panel):
         layout.use_property_split = True
 
         layout.prop(wirebomb, property='new_scene_name')
+        layout.prop(wirebomb, property='use_lean_copy')
 
 
 class WIREBOMB_PT_mesh_selection(bpy.types.Panel):
@@ -121,6 +160,11 @@ class WIREBOMB_PT_mesh_selection(bpy.types.Panel):
 
         layout.prop(wirebomb, property='use_affect_selected')
 
+        affected = selection.get_affected(context.scene, context.view_layer)
+        row = layout.row()
+        row.alignment = 'RIGHT'
+        row.label(text=f"{len(affected.objects)} objects, {affected.faces} faces affected")
+
 
 class WIREBOMB_PT_collections(bpy.types.Panel):
     bl_label = " "
@@ -173,6 +217,13 @@ class WIREBOMB_PT_wireframe(bpy.types.Panel):
         layout.use_property_split = True
         layout.prop(wirebomb, property='wireframe_method', expand=True)
 
+        if wirebomb.wireframe_method == 'FREESTYLE':
+            layout.prop(wirebomb, property='use_feature_edges')
+            sub = layout.row()
+            sub.active = wirebomb.use_feature_edges
+            sub.prop(wirebomb, property='feature_angle')
+            layout.prop(wirebomb, property='use_composite_wireframe')
+
 
 class WIREBOMB_PT_wireframe_thickness(bpy.types.Panel):
     bl_label = "Thickness"
@@ -191,8 +242,36 @@ class WIREBOMB_PT_wireframe_thickness(bpy.types.Panel):
         layout.active = wirebomb.use_wireframe
         layout.use_property_split = True
 
-        prop = 'thickness_freestyle' if wirebomb.wireframe_method == 'FREESTYLE' else 'thickness_modifier'
-        layout.prop(wirebomb, property=prop)
+        layout.prop(wirebomb, property='thickness_' + wirebomb.wireframe_method.lower())
+        if wirebomb.wireframe_method == 'MODIFIER':
+            layout.prop(wirebomb, property='use_shared_thickness')
+
+
+class WIREBOMB_PT_wireframe_budget(bpy.types.Panel):
+    bl_label = " "
+    bl_parent_id = WIREBOMB_PT_wireframe.__name__
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_options = {'DEFAULT_CLOSED'}
+    bl_order = 2
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.wirebomb.wireframe_method == 'MODIFIER'
+
+    def draw_header(self, context):
+        layout = self.layout
+        layout.prop(context.scene.wirebomb, property='use_geometry_budget')
+
+    def draw(self, context):
+        wirebomb = context.scene.wirebomb
+        layout = self.layout
+        layout.active = wirebomb.use_wireframe and wirebomb.use_geometry_budget
+        layout.use_property_split = True
+
+        layout.prop(wirebomb, property='budget_action')
+        layout.prop(wirebomb, property='budget_object_faces')
+        layout.prop(wirebomb, property='budget_memory')
 
 
 class WIREBOMB_PT_wireframe_material(bpy.types.Panel):
@@ -217,7 +296,7 @@ class WIREBOMB_PT_wireframe_material(bpy.types.Panel):
             row.use_property_split = False
             row.prop(wirebomb.material_wireframe, property='mode', expand=True)
 
-        if wirebomb.material_wireframe.mode == 'COLOR' or wirebomb.wireframe_method == 'FREESTYLE':
+        if wirebomb.material_wireframe.mode == 'COLOR' or wirebomb.wireframe_method != 'MODIFIER':
             # wireframe color
             layout.prop(wirebomb.material_wireframe, property='color')
         else:
@@ -258,6 +337,27 @@ class WIREBOMB_PT_base_material(bpy.types.Panel):
             layout.prop_search(wirebomb.material_base, 'material', bpy.data, 'materials')
 
 
+class WIREBOMB_PT_stats(bpy.types.Panel):
+    bl_label = " "
+    bl_parent_id = WIREBOMB_PT_main.__name__
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_options = {'DEFAULT_CLOSED'}
+    bl_order = 4
+
+    def draw_header(self, context):
+        layout = self.layout
+        layout.prop(context.scene.wirebomb, property='use_stats')
+
+    def draw(self, context):
+        wirebomb = context.scene.wirebomb
+        layout = self.layout
+        layout.active = wirebomb.use_stats
+        layout.use_property_split = True
+
+        layout.prop(wirebomb, property='stats_path')
+
+
 classes = (
     WIREBOMB_UL_collections,
     WIREBOMB_PT_main,
@@ -267,16 +367,34 @@ classes = (
     WIREBOMB_PT_wireframe,
     WIREBOMB_PT_wireframe_thickness,
     WIREBOMB_PT_wireframe_material,
+    WIREBOMB_PT_wireframe_budget,
     WIREBOMB_PT_base_material,
+    WIREBOMB_PT_stats,
 )
 register_classes, unregister_classes = bpy.utils.register_classes_factory(classes)
 
 
+# validating on these instead of on every depsgraph update, removed collections in between are caught when drawn
+list_update_handlers = (
+    bpy.app.handlers.load_post,
+    bpy.app.handlers.undo_post,
+    bpy.app.handlers.redo_post,
+)
+
+
 def register():
     register_classes()
-    bpy.app.handlers.depsgraph_update_pre.append(update_list_affected)
+    for handlers in list_update_handlers:
+        handlers.append(update_lists_on_event)
+    # data can't be accessed while registering
+    request_lists_update()
 
 
 def unregister():
-    bpy.app.handlers.depsgraph_update_pre.remove(update_list_affected)
+    global _is_update_pending
+    for handlers in list_update_handlers:
+        handlers.remove(update_lists_on_event)
+    if bpy.app.timers.is_registered(_run_lists_update):
+        bpy.app.timers.unregister(_run_lists_update)
+    _is_update_pending = False
     unregister_classes()
@@ -15,7 +15,11 @@
 
 # <pep8 compliant>
 
+from collections import defaultdict
+from itertools import chain
+
 import bpy
+import numpy as np
 
 # name of the master collection used in the UI
 SCENE_COLL_NAME = 'Scene Collection'
@@ -23,21 +27,49 @@ SCENE_COLL_NAME = 'Scene Collection'
 
 def get_collection_hierarchy(root_collection):
     """
-    Yields the root collection and all its children recursively.
+    Yields the root collection and all its children, depth first. A collection linked under several parents is only
+    yielded once.
 
     :param root_collection: The topmost collection to yield.
     :return: Yields the root collection and all its children, one collection at a time.
     """
-    yield root_collection
-    for collection in root_collection.children:
-        yield from get_collection_hierarchy(collection)
+    visited = set()
+    stack = [root_collection]
 
+    while stack:
+        collection = stack.pop()
+        if collection in visited:
+            continue
+        visited.add(collection)
 
-def create_basic_material(name, rgba):
-    # separating rgb and alpha
-    color_rgb = rgba[0:3]
-    color_alpha = rgba[-1]
-    material = bpy.data.materials.new(name)
+        yield collection
+        # reversed to yield the children in their order
+        stack.extend(reversed(collection.children))
+
+
+# name of the material all basic materials are copied from, hidden in the UI by the leading dot
+MATERIAL_TEMPLATE_NAME = '.Wirebomb Basic Material'
+# ID property holding the role (e.g. "Base") of a material created by the add-on
+MATERIAL_ROLE_PROP = 'wirebomb_role'
+
+# maps (role, name of the scene driving the material) to material name
+_material_cache = {}
+
+
+def get_material_template(use_ao=False, use_wireframe=False):
+    """
+    Gets the template basic materials are copied from, building it if needed.
+
+    :param use_ao: Get the variant with ambient occlusion (AO) multiplied into the color, see create_basic_material.
+    :param use_wireframe: Get the variant with a wireframe drawn over the color, see create_basic_material.
+    :return: The template material.
+    """
+    template_name = MATERIAL_TEMPLATE_NAME + (' Wireframe' if use_wireframe else '') + (' AO' if use_ao else '')
+    material = bpy.data.materials.get(template_name)
+    if material:
+        return material
+
+    material = bpy.data.materials.new(template_name)
 
     material.use_nodes = True
     tree = material.node_tree
@@ -49,12 +81,10 @@ def create_basic_material(name, rgba):
 
     node_diffuse = tree.nodes.new('ShaderNodeBsdfDiffuse')
     node_diffuse.location = -300, -100
-    node_diffuse.inputs[0].default_value = color_rgb + (1.0,)
     node_diffuse.name = 'color'  # referencing to this ID in the real-time change
 
     node_mix_shader = tree.nodes.new('ShaderNodeMixShader')
     node_mix_shader.location = 0, 50
-    node_mix_shader.inputs[0].default_value = color_alpha
     node_mix_shader.name = 'alpha'  # referencing to this ID in the real-time change
 
     node_output = tree.nodes.new('ShaderNodeOutputMaterial')
@@ -65,23 +95,490 @@ def create_basic_material(name, rgba):
     tree.links.new(node_diffuse.outputs[0], node_mix_shader.inputs[2])
     tree.links.new(node_mix_shader.outputs[0], node_output.inputs[0])
 
+    if use_ao or use_wireframe:
+        # the color now comes from an RGB node, and is mixed with the wireframe and the AO before the diffuse node
+        node_diffuse.name = 'diffuse'
+
+        node_color = tree.nodes.new('ShaderNodeRGB')
+        node_color.location = -1200, -100
+        node_color.name = 'color'  # referencing to this ID in the real-time change
+        color_output = node_color.outputs[0]
+
+        if use_wireframe:
+            node_wireframe = tree.nodes.new('ShaderNodeWireframe')
+            node_wireframe.location = -1200, 300
+            node_wireframe.use_pixel_size = False
+            node_wireframe.name = 'wireframe'  # referencing to this ID in the real-time change
+
+            node_wireframe_color = tree.nodes.new('ShaderNodeRGB')
+            node_wireframe_color.location = -1200, -300
+            node_wireframe_color.name = 'wireframe_color'  # referencing to this ID in the real-time change
+
+            node_mix_wireframe = tree.nodes.new('ShaderNodeMixRGB')
+            node_mix_wireframe.location = -900, -100
+
+            tree.links.new(node_wireframe.outputs[0], node_mix_wireframe.inputs[0])
+            tree.links.new(color_output, node_mix_wireframe.inputs[1])
+            tree.links.new(node_wireframe_color.outputs[0], node_mix_wireframe.inputs[2])
+            color_output = node_mix_wireframe.outputs[0]
+
+            # the wireframe has its own alpha, the values are mixed like the colors
+            node_alpha_base = tree.nodes.new('ShaderNodeValue')
+            node_alpha_base.location = -600, 400
+            node_alpha_base.name = 'alpha_base'  # referencing to this ID in the real-time change
+
+            node_alpha_wireframe = tree.nodes.new('ShaderNodeValue')
+            node_alpha_wireframe.location = -600, 250
+            node_alpha_wireframe.name = 'alpha_wireframe'  # referencing to this ID in the real-time change
+
+            node_mix_alpha = tree.nodes.new('ShaderNodeMixRGB')
+            node_mix_alpha.location = -300, 300
+
+            tree.links.new(node_wireframe.outputs[0], node_mix_alpha.inputs[0])
+            tree.links.new(node_alpha_base.outputs[0], node_mix_alpha.inputs[1])
+            tree.links.new(node_alpha_wireframe.outputs[0], node_mix_alpha.inputs[2])
+            tree.links.new(node_mix_alpha.outputs[0], node_mix_shader.inputs[0])
+
+        if use_ao:
+            # multiplied like the compositor's AO Effect does
+            node_ao = tree.nodes.new('ShaderNodeAmbientOcclusion')
+            node_ao.location = -900, -400
+
+            node_mix_ao = tree.nodes.new('ShaderNodeMixRGB')
+            node_mix_ao.location = -600, -100
+            node_mix_ao.blend_type = 'MULTIPLY'
+            node_mix_ao.name = 'ao'  # referencing to this ID in the real-time change
+
+            tree.links.new(color_output, node_mix_ao.inputs[1])
+            tree.links.new(node_ao.outputs['AO'], node_mix_ao.inputs[2])
+            color_output = node_mix_ao.outputs[0]
+
+        tree.links.new(color_output, node_diffuse.inputs[0])
+
     for node in tree.nodes:
         node.select = False
 
+    return material
+
+
+def get_color_path(node_tree):
+    """
+    :return: The data path of the color socket of a basic material's node tree, relative to the tree.
+    """
+    socket = 'outputs' if node_tree.nodes['color'].type == 'RGB' else 'inputs'
+    return f'nodes["color"].{socket}[0].default_value'
+
+
+def get_alpha_path(node_tree):
+    """
+    :return: The data path of the alpha socket of a basic material's node tree, relative to the tree.
+    """
+    if 'alpha_base' in node_tree.nodes:
+        return 'nodes["alpha_base"].outputs[0].default_value'
+    return 'nodes["alpha"].inputs[0].default_value'
+
+
+def create_basic_material(name, rgba, ao_factor=None, wireframe_rgba=None, wireframe_size=0.01):
+    """
+    Creates a material with a diffuse color and transparency.
+
+    :param name: The material's name.
+    :param rgba: The color, the alpha channel controls the transparency.
+    :param ao_factor: If given, ambient occlusion is multiplied into the color by this factor, through the 'ao' node.
+    :param wireframe_rgba: If given, a wireframe of this color is drawn over the color through the 'wireframe' node.
+    :param wireframe_size: The width of the wireframe in scene units.
+    :return: The material.
+    """
+    # separating rgb and alpha
+    color_rgb = tuple(rgba[0:3])
+    color_alpha = rgba[-1]
+    use_wireframe = wireframe_rgba is not None
+
+    # copying the prebuilt node tree is much cheaper than building it node by node
+    material = get_material_template(ao_factor is not None, use_wireframe).copy()
+    material.name = name
+    tree = material.node_tree
+    node_color = tree.nodes['color']
+    color_sockets = node_color.outputs if node_color.type == 'RGB' else node_color.inputs
+    color_sockets[0].default_value = color_rgb + (1.0,)
+    if use_wireframe:
+        tree.nodes['alpha_base'].outputs[0].default_value = color_alpha
+        tree.nodes['wireframe_color'].outputs[0].default_value = tuple(wireframe_rgba[0:3]) + (1.0,)
+        tree.nodes['alpha_wireframe'].outputs[0].default_value = wireframe_rgba[-1]
+        tree.nodes['wireframe'].inputs[0].default_value = wireframe_size
+    else:
+        tree.nodes['alpha'].inputs[0].default_value = color_alpha
+    if ao_factor is not None:
+        tree.nodes['ao'].inputs[0].default_value = ao_factor
+
     # sets the viewport color
     material.diffuse_color = color_rgb + (1.0,)
 
     return material
 
 
+def get_driver_target(id_data):
+    """
+    :return: The ID targeted by the first driver of a data block, or None if it has no driver or target.
+    """
+    anim_data = id_data.animation_data
+    if not anim_data or not anim_data.drivers:
+        return None
+
+    variables = anim_data.drivers[0].driver.variables
+    return variables[0].targets[0].id if variables else None
+
+
+def retarget_drivers(id_data, target_id):
+    """Points all driver variable targets of a data block to the given ID."""
+    if id_data.animation_data:
+        for fcurve in id_data.animation_data.drivers:
+            for var in fcurve.driver.variables:
+                for target in var.targets:
+                    target.id = target_id
+
+
+def get_cached_material(role, scene):
+    """
+    Finds a material created by the add-on for a role, driven by a scene's settings.
+
+    Materials left without a driving scene (e.g. after the scene they were set up for was deleted) and without users
+    are adopted by retargeting their drivers to the scene.
+
+    :param role: The material's role, e.g. "Base".
+    :param scene: The scene whose settings drive the material.
+    :return: The material, or None if no suitable material exists.
+    """
+    key = role, scene.name
+    material = bpy.data.materials.get(_material_cache.get(key, ''))
+    if material and material.get(MATERIAL_ROLE_PROP) == role and get_driver_target(material) == scene:
+        return material
+
+    for material in bpy.data.materials:
+        if material.get(MATERIAL_ROLE_PROP) != role:
+            continue
+
+        target = get_driver_target(material)
+        if target is None and material.users == 0:
+            for id_data in (material, material.node_tree):
+                retarget_drivers(id_data, scene)
+            target = scene
+
+        if target == scene:
+            _material_cache[key] = material.name
+            return material
+
+    return None
+
+
+def cache_material(material, role, scene):
+    """Marks a newly created material with its role and caches it, see get_cached_material."""
+    material[MATERIAL_ROLE_PROP] = role
+    _material_cache[role, scene.name] = material.name
+
+
+def group_by_mesh(objects):
+    """
+    Groups mesh objects by the mesh data block they use, so that linked duplicates share one entry.
+
+    :param objects: The mesh objects to group.
+    :return: A dict mapping each unique mesh to the list of given objects using it.
+    """
+    mesh_users = defaultdict(list)
+    for obj in objects:
+        mesh_users[obj.data].append(obj)
+
+    return dict(mesh_users)
+
+
 def clear_materials(meshes):
     """
     Clears materials from given meshes.
 
-    :param meshes: The meshes whose materials to clear.
+    :param meshes: The mesh data blocks whose materials to clear.
+    """
+    for mesh in meshes:
+        mesh.materials.clear()
+
+
+def find_or_append_material(mesh, material):
     """
-    for obj in meshes:
-        obj.data.materials.clear()
+    Finds the slot of a material in a mesh, appending the material if the mesh doesn't have it.
+
+    :param mesh: The mesh to search.
+    :param material: The material to find.
+    :return: The index of the material's slot.
+    """
+    for i, slot_material in enumerate(mesh.materials):
+        if slot_material == material:
+            return i
+
+    mesh.materials.append(material)
+    return len(mesh.materials) - 1
+
+
+def set_object_materials(obj, material):
+    """
+    Overrides all material slots of an object at object level, leaving its (possibly shared) mesh untouched.
+
+    :param obj: The object whose slots to override.
+    :param material: The material to use for all slots, or None to render without material.
+    """
+    for slot in obj.material_slots:
+        slot.link = 'OBJECT'
+        slot.material = material
+
+
+def set_material_index(mesh, index):
+    """
+    Assigns a material index to all polygons of a mesh in one bulk write.
+
+    :param mesh: The mesh whose polygons to assign.
+    :param index: The material index to assign.
+    :return: The number of polygons written.
+    """
+    # with a single slot every polygon renders with it regardless of its index, no need to write anything
+    if len(mesh.materials) == 1:
+        return 0
+
+    polygons = mesh.polygons
+    polygons.foreach_set('material_index', np.full(len(polygons), index, dtype=np.int32))
+    mesh.update_tag()
+
+    return len(polygons)
+
+
+def find_feature_edges(mesh, min_angle):
+    """
+    Finds the edges of a mesh that outline its shape, using vectorized operations on the whole mesh at once.
+
+    :param mesh: The mesh to search.
+    :param min_angle: The minimum angle in radians between the normals of the two faces of an edge for it to count.
+    :return: A bool array of whether each edge is a feature edge, i.e. an edge on a boundary or between more than two
+    faces, a loose edge, a seam, an edge marked sharp, or an edge whose faces' normals are at least min_angle apart.
+    """
+    edges, polygons, loops = mesh.edges, mesh.polygons, mesh.loops
+    n_edges = len(edges)
+
+    seams = np.empty(n_edges, dtype=bool)
+    edges.foreach_get('use_seam', seams)
+    sharp = np.empty(n_edges, dtype=bool)
+    edges.foreach_get('use_edge_sharp', sharp)
+
+    normals = np.empty(len(polygons) * 3, dtype=np.float32)
+    polygons.foreach_get('normal', normals)
+    normals.shape = (-1, 3)
+    loop_totals = np.empty(len(polygons), dtype=np.int32)
+    polygons.foreach_get('loop_total', loop_totals)
+    loop_edges = np.empty(len(loops), dtype=np.int32)
+    loops.foreach_get('edge_index', loop_edges)
+
+    # the face of each loop, the faces of an edge are then adjacent once the loops are sorted by edge
+    loop_faces = np.repeat(np.arange(len(polygons), dtype=np.int32), loop_totals)
+    order = np.argsort(loop_edges, kind='stable')
+    sorted_faces = loop_faces[order]
+    face_counts = np.bincount(loop_edges, minlength=n_edges)
+    first_loops = np.cumsum(face_counts) - face_counts
+
+    # edges with any other number of faces than two have no angle and always count
+    is_feature = face_counts != 2
+    manifold = np.flatnonzero(~is_feature)
+    first_faces = sorted_faces[first_loops[manifold]]
+    second_faces = sorted_faces[first_loops[manifold] + 1]
+    # comparing cosines, the angle grows as its cosine shrinks
+    cosines = np.einsum('ij,ij->i', normals[first_faces], normals[second_faces])
+    is_feature[manifold] = cosines <= np.cos(min_angle)
+
+    return is_feature | seams | sharp
+
+
+# ID property of meshes holding the indexes of the edges that were marked as Freestyle edges before the add-on marked
+# them
+FREESTYLE_MARKS_PROP = 'wirebomb_freestyle_marks'
+
+
+def save_freestyle_marks(mesh):
+    """Keeps the Freestyle edge marks of a mesh for restore_freestyle_marks, unless they're kept already."""
+    if FREESTYLE_MARKS_PROP in mesh:
+        return
+
+    edges = mesh.edges
+    marks = np.empty(len(edges), dtype=bool)
+    edges.foreach_get('use_freestyle_mark', marks)
+    mesh[FREESTYLE_MARKS_PROP] = np.flatnonzero(marks).tolist()
+
+
+def restore_freestyle_marks(mesh):
+    """
+    Restores the Freestyle edge marks a mesh had before it was first marked by mark_freestyle_edges, or clears all of
+    its marks if they weren't kept.
+    """
+    edges = mesh.edges
+    marks = np.zeros(len(edges), dtype=bool)
+    marked = mesh.get(FREESTYLE_MARKS_PROP)
+    if marked is not None:
+        indexes = np.array(list(marked), dtype=np.int64)
+        # edges may have been removed since
+        marks[indexes[indexes < len(edges)]] = True
+        del mesh[FREESTYLE_MARKS_PROP]
+
+    edges.foreach_set('use_freestyle_mark', marks)
+    mesh.update_tag()
+
+
+def mark_freestyle_edges(meshes, feature_angle=None):
+    """
+    Marks the edges of the given meshes as Freestyle edges, writing each mesh only once. The marks the meshes had
+    before are kept, see restore_freestyle_marks.
+
+    :param meshes: The meshes whose edges to mark, may contain duplicates.
+    :param feature_angle: If given, only the feature edges are marked, see find_feature_edges, and the marks of the
+    other edges are cleared. Else, all edges are marked.
+    :return: The number of edges marked.
+    """
+    n_marked = 0
+    for mesh in set(meshes):
+        edges = mesh.edges
+        if feature_angle is None:
+            marks = np.ones(len(edges), dtype=bool)
+        else:
+            marks = find_feature_edges(mesh, feature_angle)
+        save_freestyle_marks(mesh)
+        edges.foreach_set('use_freestyle_mark', marks)
+        mesh.update_tag()
+        n_marked += int(np.count_nonzero(marks))
+
+    return n_marked
+
+
+# per view layer flags of layer collections, kept when a collection is swapped for its copy
+LAYER_COLLECTION_FLAGS = ('exclude', 'hide_viewport', 'holdout', 'indirect_only')
+
+
+def copy_scene(scene, name, objects=None, data=None):
+    """
+    Copies a scene without needing a window. By default this is a full copy like the New Scene operator's Full Copy.
+
+    Collections, objects and object data are duplicated (linked duplicates stay linked to the same copied data),
+    other data blocks such as materials and worlds are shared with the original. When only some objects are to be
+    copied, the other objects are shared with the original scene, as are collections that only hold shared objects.
+
+    :param scene: The scene to copy.
+    :param name: The name of the new scene.
+    :param objects: The objects to copy, defaults to all objects in the scene.
+    :param data: The object data to copy, defaults to the data of all copied objects. Copied objects whose data isn't
+    copied keep sharing it with the original.
+    :return: The new scene, a dict mapping the copied objects to their copies and a dict mapping the copied object data
+    to their copies.
+    """
+    new_scene = scene.copy()
+    new_scene.name = name
+
+    is_full_copy = objects is None
+    if is_full_copy:
+        objects = scene.objects
+
+    data_copies = {}
+    object_copies = {}
+    for obj in objects:
+        obj_copy = object_copies[obj] = obj.copy()
+        if obj.data is not None and (data is None or obj.data in data):
+            data_copy = data_copies.get(obj.data)
+            if data_copy is None:
+                data_copy = data_copies[obj.data] = obj.data.copy()
+            obj_copy.data = data_copy
+
+    layer_flags = _get_layer_collection_flags(new_scene)
+    collection_copies = {}
+    _relink_collection(new_scene.collection, object_copies, collection_copies, is_full_copy)
+    _set_layer_collection_flags(new_scene, layer_flags, collection_copies)
+
+    # pointing references between the copied objects to the copies
+    for obj_copy in object_copies.values():
+        _remap_object_pointers(obj_copy, object_copies)
+        for struct in chain(obj_copy.modifiers, obj_copy.constraints):
+            _remap_object_pointers(struct, object_copies)
+    _remap_object_pointers(new_scene, object_copies)
+
+    if new_scene.node_tree:
+        for node in new_scene.node_tree.nodes:
+            if node.type == 'R_LAYERS' and node.scene == scene:
+                node.scene = new_scene
+
+    return new_scene, object_copies, data_copies
+
+
+def _relink_collection(collection, object_copies, collection_copies, copy_all):
+    """
+    Replaces the copied objects of a collection with their copies, and its child collections with copies of them.
+
+    Unless copy_all is set, child collections without any copied object in them are kept as they are.
+    """
+    for obj in [obj for obj in collection.objects if obj in object_copies]:
+        collection.objects.unlink(obj)
+        collection.objects.link(object_copies[obj])
+
+    for child in list(collection.children):
+        child_copy = collection_copies.get(child)
+        if child_copy is None:
+            if not copy_all and not any(obj in object_copies for obj in child.all_objects):
+                continue
+
+            # a collection may be linked under several parents, it's only copied once
+            child_copy = collection_copies[child] = child.copy()
+            _relink_collection(child_copy, object_copies, collection_copies, copy_all)
+        collection.children.unlink(child)
+        collection.children.link(child_copy)
+
+
+def _get_layer_collection_flags(scene):
+    flags = {}
+    for view_layer in scene.view_layers:
+        layer_colls = [view_layer.layer_collection]
+        while layer_colls:
+            layer_coll = layer_colls.pop()
+            flags[view_layer.name, layer_coll.collection] = [getattr(layer_coll, flag)
+                                                             for flag in LAYER_COLLECTION_FLAGS]
+            layer_colls.extend(layer_coll.children)
+
+    return flags
+
+
+def _set_layer_collection_flags(scene, flags, collection_copies):
+    originals = {copy: original for original, copy in collection_copies.items()}
+    for view_layer in scene.view_layers:
+        layer_colls = [view_layer.layer_collection]
+        while layer_colls:
+            layer_coll = layer_colls.pop()
+            values = flags.get((view_layer.name, originals.get(layer_coll.collection, layer_coll.collection)))
+            if values:
+                for flag, value in zip(LAYER_COLLECTION_FLAGS, values):
+                    setattr(layer_coll, flag, value)
+            layer_colls.extend(layer_coll.children)
+
+
+# maps RNA struct identifiers to the names of their editable object pointer properties
+_object_pointer_props = {}
+
+
+def _get_object_pointer_props(struct):
+    rna = struct.bl_rna
+    prop_names = _object_pointer_props.get(rna.identifier)
+    if prop_names is None:
+        # introspecting every property is slow, so only done once per struct type
+        prop_names = _object_pointer_props[rna.identifier] = tuple(
+            prop.identifier for prop in rna.properties
+            if prop.type == 'POINTER' and not prop.is_readonly and prop.fixed_type.identifier == 'Object')
+
+    return prop_names
+
+
+def _remap_object_pointers(struct, object_copies):
+    """Points all editable object pointers of a struct (object, modifier, constraint, scene) to the copies."""
+    for prop_name in _get_object_pointer_props(struct):
+        value = getattr(struct, prop_name)
+        if value in object_copies:
+            setattr(struct, prop_name, object_copies[value])
 
 
 def collection_from_name(scene, coll_name):
@@ -15,105 +15,503 @@
 
 # <pep8 compliant>
 
+import json
 from collections import defaultdict
 from itertools import chain
-from operator import attrgetter
+from time import perf_counter
 
 import bpy
 
+from . import geometry
+from . import profiles
+from . import selection
+from . import stats
+from . import teardown
 from . import utils
 
+# settings an update doesn't have to set up objects again for: values followed by drivers, settings of how the setup
+# runs, and the selection, whose changes are found object by object
+FINGERPRINT_IGNORED = {'ao_factor', 'thickness_freestyle', 'thickness_modifier', 'thickness_shader',
+                       'use_new_scene', 'use_lean_copy', 'new_scene_name',
+                       'affect_mode', 'use_affect_selected', 'use_affect_collections', 'collections_affected',
+                       'use_incremental', 'use_stats', 'stats_path'}
+
+
+class SetUpResult:
+    """The outcome of a setup."""
+
+    def __init__(self, scene, view_layer, objects, error_msg, seconds, setup_stats, warnings=()):
+        # the scene that was set up, which is the new scene if one was created
+        self.scene = scene
+        self.view_layer = view_layer
+        # the affected objects in that scene
+        self.objects = objects
+        # empty iff the setup succeeded
+        self.error_msg = error_msg
+        self.seconds = seconds
+        # SetUpStats if statistics were enabled, else NullStats
+        self.stats = setup_stats
+        # problems that didn't stop the setup
+        self.warnings = list(warnings)
+
+    @property
+    def succeeded(self):
+        return not self.error_msg
+
+    def to_dict(self):
+        return {
+            'scene': self.scene.name,
+            'view_layer': self.view_layer.name,
+            'objects': len(self.objects),
+            'meshes': len({obj.data for obj in self.objects}),
+            'error': self.error_msg,
+            'seconds': round(self.seconds, 3),
+            'stats': self.stats.to_dict() if self.stats.enabled else None,
+            'warnings': self.warnings,
+        }
+
+
+def set_up(scene, view_layer=None, settings=None, window_manager=None):
+    """
+    Sets up a scene for wireframe rendering without depending on a window, e.g. in background mode.
+
+    :param scene: The scene to set up.
+    :param view_layer: The view layer whose selection and AO pass to use, defaults to the scene's first view layer.
+    :param settings: The Wirebomb settings to use, defaults to the scene's own.
+    :param window_manager: Window manager to report progress to, progress is not reported if None.
+    :return: A SetUpResult.
+    """
+    start = perf_counter()
+    wirebomb_scene = Wirebomb(scene, view_layer, settings, window_manager)
+    error_msg = wirebomb_scene.set_up_new()
+    return wirebomb_scene.get_result(error_msg, perf_counter() - start)
+
 
 class Wirebomb:
-    def __init__(self, scene):
+    def __init__(self, scene, view_layer=None, settings=None, window_manager=None):
         self.scene = self.original_scene = scene
-        self.wirebomb = scene.wirebomb
-        self.meshes_affected = self.find_meshes_affected()
+        self.view_layer = view_layer or scene.view_layers[0]
+        self.wirebomb = settings or scene.wirebomb
+        self.window_manager = window_manager
+        self.stats = stats.SetUpStats() if self.wirebomb.use_stats else stats.NULL_STATS
+        self.meshes_affected = self.mesh_users = None
+        with self.stats.stage('find_meshes'):
+            self.set_meshes_affected(self.find_meshes_affected())
         self.progress = -1
+        # whether an existing setup is updated rather than a new one built
+        self.is_update = False
+        # maps recorded objects to their index in the record
+        self.recorded = {}
+        # names of the wireframe modifiers used, by object
+        self.modifier_names = {}
+        # affected meshes shared with another scene, only changed through object level material slots
+        self.shared_meshes = set()
+        # the materials of this setup, None if not used
+        self.material_base = self.material_wireframe = None
+        # objects already in the Freestyle wireframe collection
+        self.wireframe_linked = set()
+        # the affected meshes in the order they are set up, and how many of them are
+        self.meshes_ordered = []
+        self.n_meshes_done = 0
+        # objects left without a wireframe modifier since they are over the geometry budget
+        self.objects_over_budget = set()
+        self.warnings = []
+        # the settings deciding what set_up_meshes does, fixed by begin_set_up for the whole setup since they can be
+        # edited while a modal setup runs. The wireframe method is None without a wireframe, the feature angle None
+        # unless only feature edges are marked.
+        self.use_clear_materials = self.use_base = self.use_shared_thickness = False
+        self.wireframe_method = self.feature_angle = None
+        self.settings_fingerprint = ''
+
+    @property
+    def record(self):
+        return self.wirebomb.record
+
+    def set_meshes_affected(self, objects):
+        """
+        Plans the setup for the given objects.
+
+        Mesh level changes (materials, edge marks) are made once per unique mesh in `mesh_users`, object level changes
+        (modifiers, collections) once per object in `meshes_affected`.
+
+        :param objects: The affected mesh objects.
+        """
+        self.meshes_affected = list(objects)
+        self.mesh_users = utils.group_by_mesh(self.meshes_affected)
 
     def begin_progress(self, min_val, max_val):
-        bpy.context.window_manager.progress_begin(min_val, max_val)
+        if self.window_manager:
+            self.window_manager.progress_begin(min_val, max_val)
         self.progress = min_val
 
-    @staticmethod
-    def end_progress():
-        bpy.context.window_manager.progress_end()
+    def end_progress(self):
+        if self.window_manager:
+            self.window_manager.progress_end()
 
     def update_progress(self, value):
-        bpy.context.window_manager.progress_update(value)
+        if self.window_manager:
+            self.window_manager.progress_update(value)
         self.progress = value
 
-    def increment_progress(self, step):
-        bpy.context.window_manager.progress_update(self.update_progress(self.progress + step))
+    @property
+    def meshes_done(self):
+        return self.meshes_ordered[:self.n_meshes_done]
+
+    @property
+    def objects_done(self):
+        """The affected objects set up so far, i.e. the users of the meshes set up."""
+        return [obj for mesh in self.meshes_done for obj in self.mesh_users[mesh]]
+
+    @property
+    def is_done(self):
+        return self.n_meshes_done == len(self.meshes_ordered)
+
+    def get_result(self, error_msg, seconds):
+        """
+        :return: A SetUpResult of the setup so far.
+        """
+        return SetUpResult(self.scene, self.view_layer, self.objects_done, error_msg or '', seconds, self.stats,
+                           self.warnings)
 
     def set_up_new(self):
-        self.begin_progress(0, 101)
+        """
+        Does the whole setup in one go.
+
+        :return: Error messages if the configuration is invalid, else None.
+        """
         error_msg = self.error_check()
         if error_msg:
             return error_msg
 
-        if self.wirebomb.use_new_scene:
-            self.copy_scene(self.wirebomb.new_scene_name)
-        self.update_progress(26)
+        self.begin_set_up()
+        self.set_up_meshes(len(self.meshes_ordered))
+        self.finish_set_up()
 
-        if self.wirebomb.use_clear_materials:
-            utils.clear_materials(self.meshes_affected)
-        self.update_progress(48)
+        return None
+
+    def begin_set_up(self):
+        """
+        Does the part of the setup that doesn't depend on the number of affected objects, e.g. creating the scene copy
+        and the materials. The affected meshes are then set up by `set_up_meshes`, and the setup is completed by
+        `finish_set_up`.
+
+        Assumes that `error_check` found no errors.
+        """
+        settings = self.wirebomb
+        self.use_clear_materials = settings.use_clear_materials
+        self.use_base = settings.use_base
+        self.use_shared_thickness = settings.use_shared_thickness
+        self.wireframe_method = settings.wireframe_method if settings.use_wireframe else None
+        self.feature_angle = settings.feature_angle if settings.use_feature_edges else None
+        self.settings_fingerprint = self.get_settings_fingerprint()
+
+        self.is_update = self.wirebomb.use_incremental and self.record.is_set_up
+        if self.is_update:
+            self.prepare_update()
+            if self.settings_changed:
+                with self.stats.stage('undo_recorded'):
+                    self.undo_recorded()
+
+        over_budget = None
+        if (self.wirebomb.use_wireframe and self.wirebomb.wireframe_method == 'MODIFIER'
+                and self.wirebomb.use_geometry_budget):
+            # before anything is created
+            with self.stats.stage('geometry_budget'):
+                over_budget = self.check_geometry_budget()
+
+        if not self.is_update:
+            if self.wirebomb.use_new_scene:
+                with self.stats.stage('copy_scene'):
+                    self.copy_scene(self.wirebomb.new_scene_name)
+            self.record.clear()
+            # a copied scene's list holds the original's modifiers, a rebuilt one those of the previous setup
+            self.wirebomb.shared_thickness_modifiers.clear()
+            if self.scene != self.original_scene:
+                self.record.source_scene = self.original_scene
+
+        if over_budget is not None and self.wirebomb.budget_action == 'SKIP':
+            # the copies keep the order of the originals
+            self.objects_over_budget = {obj for obj, over in zip(self.meshes_affected, over_budget) if over}
+
+        self.stats.count('objects', len(self.meshes_affected))
+        self.stats.count('meshes', len(self.mesh_users))
+        self.meshes_ordered = list(self.mesh_users)
+        self.n_meshes_done = 0
+        # progress is counted in objects set up
+        self.begin_progress(0, len(self.meshes_affected))
 
         if self.wirebomb.use_base:
-            # sets up base material
-            self.set_up_base_material()
-        self.update_progress(64)
+            with self.stats.stage('base_material'):
+                self.material_base = self.set_up_material("Base", self.wirebomb.material_base, 'material_base',
+                                                          self.use_shader_wireframe)
 
         if self.wirebomb.use_wireframe:
-            # sets up wireframe
-            wireframe_method = self.wirebomb.wireframe_method
-            if wireframe_method == 'MODIFIER':
-                self.set_up_wireframe_modifier()
-            elif wireframe_method == 'FREESTYLE':
-                self.set_up_wireframe_freestyle()
-        self.update_progress(80)
+            with self.stats.stage('wireframe'):
+                if self.wirebomb.wireframe_method == 'MODIFIER':
+                    self.material_wireframe = self.set_up_material("Wireframe", self.wirebomb.material_wireframe,
+                                                                   'material_wireframe')
+                elif self.wirebomb.wireframe_method == 'FREESTYLE':
+                    self.set_up_freestyle_line_sets()
+                    if self.use_composite_wireframe:
+                        # before the AO, which then only darkens the image under the lines
+                        self.set_up_comp_wireframe()
 
         if self.wirebomb.use_ao:
-            self.set_up_ao()
-        self.end_progress()
+            with self.stats.stage('ao'):
+                self.set_up_ao()
 
-        return None
+    def set_up_meshes(self, count):
+        """
+        Sets up the next affected meshes, along with all of their users.
 
-    def copy_scene(self, new_scene_name):
-        tag = 'wirebomb'
+        :param count: The maximum number of meshes to set up.
+        :return: The number of meshes set up.
+        """
+        meshes = self.meshes_ordered[self.n_meshes_done:self.n_meshes_done + count]
+
+        if self.use_clear_materials:
+            with self.stats.stage('clear_materials'):
+                self.clear_materials(meshes)
+
+        if self.use_base:
+            with self.stats.stage('base_material'):
+                self.set_up_base_material(meshes)
+
+        if self.wireframe_method:
+            with self.stats.stage('wireframe'):
+                if self.wireframe_method == 'MODIFIER':
+                    self.set_up_wireframe_modifier(meshes)
+                elif self.wireframe_method == 'FREESTYLE':
+                    self.set_up_wireframe_freestyle(meshes)
+
+        self.n_meshes_done += len(meshes)
+        self.update_progress(self.progress + sum(len(self.mesh_users[mesh]) for mesh in meshes))
+        return len(meshes)
+
+    def set_up_meshes_for(self, seconds):
+        """
+        Sets up affected meshes one at a time until the given time is up, or none are left.
 
-        # tagging all affected meshes to be able to track their copies in the new scene
-        for obj in self.meshes_affected:
-            obj[tag] = None
+        :param seconds: The time budget. At least one mesh is set up, however long it takes.
+        :return: The number of meshes set up.
+        """
+        deadline = perf_counter() + seconds
+        n_done = 0
+        while not self.is_done:
+            n_done += self.set_up_meshes(1)
+            if perf_counter() >= deadline:
+                break
+
+        return n_done
 
-        bpy.ops.scene.new(type='FULL_COPY')
-        new_scene = bpy.context.window.scene
-        new_scene.name = new_scene_name
+    def finish_set_up(self):
+        """
+        Records the setup and writes the statistics. If not all meshes were set up, e.g. since the setup was cancelled,
+        only those that were are recorded, so that an incremental setup can set up the rest.
+        """
+        self.update_record()
+        self.end_progress()
 
-        # removing tags because no longer needed
-        for obj in self.meshes_affected:
-            del obj[tag]
+        if self.stats.enabled and self.wirebomb.stats_path:
+            self.stats.write_json(bpy.path.abspath(self.wirebomb.stats_path))
 
-        # storing the tagged copies
-        new_meshes_affected = []
+    def prepare_update(self):
+        """
+        Narrows the affected objects down to those an update of the recorded setup has to process, which is all of
+        them if the settings changed since.
+        """
+        # meshes set up through object level slots, i.e. shared with the scene this one was copied from
+        self.shared_meshes = {mesh for mesh, users in self.mesh_users.items()
+                              if mesh.materials and all(slot.link == 'OBJECT'
+                                                        for obj in users for slot in obj.material_slots)}
+        self.recorded = {item.object: i for i, item in enumerate(self.record.objects)}
+        if not self.settings_changed:
+            self.set_meshes_affected(self.filter_changed(self.meshes_affected))
+
+    def get_settings_fingerprint(self):
+        """
+        :return: A string that changes iff a setting changes that objects set up earlier would have to be set up again
+        for, e.g. the wireframe method.
+        """
+        profile = profiles.make_profile(self.wirebomb)
+        for name in FINGERPRINT_IGNORED:
+            profile.pop(name, None)
+        # driven too, unless another material is picked, which the mode and material tell
+        for name in ('material_base', 'material_wireframe'):
+            profile[name].pop('color', None)
+        return json.dumps(profile, sort_keys=True)
+
+    @property
+    def settings_changed(self):
+        """Whether the settings changed since the recorded setup, see get_settings_fingerprint."""
+        return self.record.settings_fingerprint != (self.settings_fingerprint or self.get_settings_fingerprint())
+
+    def undo_recorded(self):
+        """
+        Undoes the recorded setup in this scene so that all affected objects are set up again with the current
+        settings. The materials, collection, line style and world it created are kept, and reused if still needed, the
+        compositor node groups are removed.
+        """
+        teardown.undo_in_place(self.scene, self.wirebomb, teardown.find_created(self.record))
+        # the compositor groups are built for the view layer nodes there are when they're set up, so they're rebuilt
+        # rather than left unused
+        for record_prop in ('ao_node_group', 'wireframe_node_group'):
+            group_tree = getattr(self.record, record_prop)
+            setattr(self.record, record_prop, None)
+            if group_tree and group_tree.users == 0:
+                bpy.data.node_groups.remove(group_tree)
+        self.record.objects.clear()
+        self.wirebomb.shared_thickness_modifiers.clear()
+        self.recorded = {}
+
+    def check_geometry_budget(self):
+        """
+        Estimates the geometry the wireframe modifiers will generate, and warns if it's over the budget.
 
-        for obj in [obj for obj in new_scene.objects if tag in obj]:
-            del obj[tag]
-            new_meshes_affected.append(obj)
+        :return: A bool array of whether each affected object, in order, is over the budget.
+        """
+        estimate = geometry.estimate_wireframe(self.meshes_affected)
+        over_budget = estimate.find_over_budget(self.wirebomb.budget_object_faces,
+                                                self.wirebomb.budget_memory * 2 ** 20)
+        self.stats.count('estimated_faces', int(estimate.faces.sum()))
+
+        n_over = int(over_budget.sum())
+        if n_over:
+            totals = estimate.to_dict()
+            action = ("Their wireframes are left out" if self.wirebomb.budget_action == 'SKIP'
+                      else "Their wireframes are added anyway")
+            self.warnings.append(f"{n_over} of {totals['objects']} objects are over the geometry budget "
+                                 f"(estimated {totals['faces']} faces, {totals['megabytes']} MB in total). {action}.")
+
+        return over_budget
+
+    def filter_changed(self, objects):
+        """
+        Finds the objects that need processing when updating the recorded setup.
 
-        self.meshes_affected = new_meshes_affected
+        :param objects: The affected objects.
+        :return: The objects that are new or whose mesh changed since the setup, along with all affected objects
+        sharing a mesh with those.
+        """
+        signature = self.record.signature
+        changed_meshes = set()
+        for obj in objects:
+            index = self.recorded.get(obj)
+            if index is None:
+                changed_meshes.add(obj.data)
+            else:
+                item = self.record.objects[index]
+                if item.mesh != obj.data or item.signature != signature(obj.data):
+                    changed_meshes.add(obj.data)
+
+        return [obj for obj in objects if obj.data in changed_meshes]
+
+    def update_record(self):
+        """Records the processed objects, the created data blocks are recorded as they are created."""
+        record = self.record
+        for obj in self.objects_done:
+            index = self.recorded.get(obj)
+            if index is None:
+                record.objects.add()
+                index = self.recorded[obj] = len(record.objects) - 1
+
+            # accessing by index since adding to the collection may move its items in memory
+            item = record.objects[index]
+            item.object = obj
+            item.mesh = obj.data
+            item.signature = record.signature(obj.data)
+            item.modifier = self.modifier_names.get(obj, item.modifier)
+
+        record.settings_fingerprint = self.settings_fingerprint
+        record.is_set_up = True
+
+    def get_recorded_modifier(self, obj):
+        """
+        :return: The wireframe modifier a previous setup added to the object, or None.
+        """
+        index = self.recorded.get(obj)
+        if index is None:
+            return None
+
+        modifier_name = self.record.objects[index].modifier
+        return obj.modifiers.get(modifier_name) if modifier_name else None
+
+    def copy_scene(self, new_scene_name):
+        if self.wirebomb.use_lean_copy:
+            # only the affected objects are copied, and only the meshes that must be changed
+            private_meshes = self.find_meshes_changed()
+            new_scene, object_copies, data_copies = utils.copy_scene(self.scene, new_scene_name,
+                                                                     self.meshes_affected, private_meshes)
+            self.shared_meshes = set(self.mesh_users) - private_meshes
+        else:
+            new_scene, object_copies, data_copies = utils.copy_scene(self.scene, new_scene_name)
+        # the scene, plus the copied objects and their data
+        self.stats.count('datablocks_created', 1 + len(object_copies) + len(data_copies))
+
+        self.set_meshes_affected(object_copies[obj] for obj in self.meshes_affected)
+        self.view_layer = new_scene.view_layers[self.view_layer.name]
+        # the copy brings its own settings, keep using the given ones if they belong to another scene
+        if self.wirebomb.id_data == self.scene:
+            self.wirebomb = new_scene.wirebomb
         self.scene = new_scene
-        self.wirebomb = new_scene.wirebomb
+
+    def find_meshes_changed(self):
+        """
+        Finds the affected meshes the setup has to change. Material changes are made on object level when possible.
+
+        :return: A set of the meshes.
+        """
+        if self.wirebomb.use_wireframe and self.wirebomb.wireframe_method in {'MODIFIER', 'FREESTYLE'}:
+            # an extra material slot for the modifier, or Freestyle edge marks
+            return set(self.mesh_users)
+        if self.wirebomb.use_base:
+            # can't override slots on object level if there are none
+            return {mesh for mesh in self.mesh_users if not mesh.materials}
+
+        return set()
+
+    def clear_materials(self, meshes):
+        utils.clear_materials(mesh for mesh in meshes if mesh not in self.shared_meshes)
+        for mesh in meshes:
+            if mesh in self.shared_meshes:
+                for obj in self.mesh_users[mesh]:
+                    utils.set_object_materials(obj, None)
+
+    @property
+    def use_shader_wireframe(self):
+        """Whether the wireframe is drawn by the base material instead of by separate geometry or Freestyle."""
+        return self.wirebomb.use_wireframe and self.wirebomb.wireframe_method == 'SHADER'
+
+    @property
+    def use_composite_wireframe(self):
+        """Whether the Freestyle wireframe is rendered to its own pass and colored in the compositor."""
+        return (self.wirebomb.use_wireframe and self.wirebomb.wireframe_method == 'FREESTYLE'
+                and self.wirebomb.use_composite_wireframe)
+
+    @property
+    def use_shader_ao(self):
+        """Whether the AO is part of the generated materials instead of added in the compositor."""
+        return self.wirebomb.use_ao and self.wirebomb.ao_method == 'SHADER'
 
     def set_up_ao(self):
         self.scene.eevee.use_gtao = True
-        bpy.context.window.view_layer.use_pass_ambient_occlusion = True
         self.set_up_world_ao()
-        self.set_up_comp_ao()
+        if not self.use_shader_ao:
+            self.view_layer.use_pass_ambient_occlusion = True
+            self.set_up_comp_ao()
 
-    def set_up_comp_ao(self):
-        """Sets up the compositor nodes for the ambient occlusion (AO) effect."""
+    def has_comp_group(self, group_tree):
+        """Whether the compositor has a group node of the given node group."""
+        return bool(group_tree and self.scene.node_tree
+                    and any(node.type == 'GROUP' and node.node_tree == group_tree
+                            for node in self.scene.node_tree.nodes))
+
+    def enable_compositor(self):
+        """
+        Turns on the compositor's nodes.
+
+        :return: The compositor's node tree.
+        """
         if not self.scene.use_nodes:
             self.scene.use_nodes = True
             if self.wirebomb.use_new_scene:
@@ -121,18 +519,32 @@ class Wirebomb:
                 # view layer nodes are not automatically updated to use the new scene instead of the original
                 # (possibly a Blender bug)
                 for node in [node for node in self.scene.node_tree.nodes
-                             if node.type == 'R_LAYERS' and node.scene is self.original_scene]:
+                             if node.type == 'R_LAYERS' and node.scene == self.original_scene]:
                     node.scene = self.scene
 
-        tree = self.scene.node_tree
+        return self.scene.node_tree
 
+    @staticmethod
+    def find_view_layer_links(tree):
+        """
+        :return: A dict mapping the view layer nodes whose image socket has some link to those links.
+        """
         v_layer_nodes_links = defaultdict(list)
         for link in tree.links:
-            # only care about view layer nodes whose image socket has some link
             if link.from_node.type == 'R_LAYERS' and link.from_socket.identifier == 'Image':
                 v_layer_nodes_links[link.from_node].append(link)
+        return v_layer_nodes_links
+
+    def set_up_comp_ao(self):
+        """Sets up the compositor nodes for the ambient occlusion (AO) effect, unless already set up."""
+        if self.has_comp_group(self.record.ao_node_group):
+            return
+
+        tree = self.enable_compositor()
+        v_layer_nodes_links = self.find_view_layer_links(tree)
 
-        group_tree = bpy.data.node_groups.new('AO Effect', 'CompositorNodeTree')
+        group_tree = self.record.ao_node_group = bpy.data.node_groups.new('AO Effect', 'CompositorNodeTree')
+        self.stats.count('datablocks_created')
         node_group = tree.nodes.new('CompositorNodeGroup')
         node_group.node_tree = group_tree
 
@@ -144,7 +556,9 @@ class Wirebomb:
         group_tree.inputs.new('NodeSocketFloatFactor', fac_socket_name)
         group_tree.inputs[fac_socket_name].min_value = 0
         group_tree.inputs[fac_socket_name].max_value = 1
-        node_group.inputs[fac_socket_name].default_value = 0.730
+        node_group.inputs[fac_socket_name].default_value = self.wirebomb.ao_factor
+        self.add_driver(self.wirebomb.path_from_id('ao_factor'), tree,
+                        f'nodes["{node_group.name}"].inputs["{fac_socket_name}"].default_value')
 
         y_location = 0
 
@@ -180,78 +594,242 @@ class Wirebomb:
         for node in chain(tree.nodes, group_tree.nodes):
             node.select = False
 
-    def set_up_base_material(self):
-        """Adds base material to affected meshes and saves material name."""
-        base_mat = self.set_up_material("Base", self.wirebomb.material_base)
+    def set_up_comp_wireframe(self):
+        """
+        Sets up the compositor nodes drawing the Freestyle render pass over the image in the wireframe color, unless
+        already set up.
+        """
+        if self.has_comp_group(self.record.wireframe_node_group):
+            return
+
+        tree = self.enable_compositor()
+        v_layer_nodes_links = self.find_view_layer_links(tree)
+
+        group_tree = self.record.wireframe_node_group = bpy.data.node_groups.new('Wireframe Effect',
+                                                                                 'CompositorNodeTree')
+        self.stats.count('datablocks_created')
+        node_group = tree.nodes.new('CompositorNodeGroup')
+        node_group.node_tree = group_tree
+        node_group.location.y = -200
 
-        for obj in self.meshes_affected:
-            mat_index = len(obj.data.materials)
-            obj.data.materials.append(base_mat)
+        group_outputs = group_tree.nodes.new('NodeGroupOutput')
+        group_outputs.location.x = 600
+        group_inputs = group_tree.nodes.new('NodeGroupInput')
+        group_inputs.location.x = -400
+        color_socket_name = 'Color'
+        alpha_socket_name = 'Alpha'
+        group_tree.inputs.new('NodeSocketColor', color_socket_name)
+        group_tree.inputs.new('NodeSocketFloatFactor', alpha_socket_name)
+        group_tree.inputs[alpha_socket_name].min_value = 0
+        group_tree.inputs[alpha_socket_name].max_value = 1
+
+        wireframe_color = self.wirebomb.material_wireframe.color
+        node_group.inputs[color_socket_name].default_value = wireframe_color[:3] + (1.0,)
+        node_group.inputs[alpha_socket_name].default_value = wireframe_color[3]
+        driving_prop = self.wirebomb.material_wireframe.path_from_id('color')
+        inputs_path = f'nodes["{node_group.name}"].inputs'
+        for i in range(3):
+            self.add_driver(driving_prop, tree, f'{inputs_path}["{color_socket_name}"].default_value', i, i)
+        self.add_driver(driving_prop, tree, f'{inputs_path}["{alpha_socket_name}"].default_value', 3)
 
-            for polygon in obj.data.polygons:
-                polygon.material_index = mat_index
+        y_location = 0
+
+        for node_n, (node_v_layer, links) in enumerate(v_layer_nodes_links.items()):
+            # the pass's alpha is where the lines are, the line style is white and opaque
+            node_separate = group_tree.nodes.new('CompositorNodeSepRGBA')
+            node_separate.location = -200, y_location
+            node_alpha = group_tree.nodes.new('CompositorNodeMath')
+            node_alpha.operation = 'MULTIPLY'
+            node_alpha.use_clamp = True
+            node_alpha.location = 0, y_location
+            node_mix = group_tree.nodes.new('CompositorNodeMixRGB')
+            node_mix.location = 200, y_location
+            y_location -= 200
+
+            # unique i/o socket names
+            image_socket_name = 'Image ' + str(node_n)
+            freestyle_socket_name = 'Freestyle ' + str(node_n)
+
+            group_tree.inputs.new('NodeSocketColor', freestyle_socket_name)
+            tree.links.new(node_v_layer.outputs['Freestyle'], node_group.inputs[freestyle_socket_name])
+            group_tree.links.new(group_inputs.outputs[freestyle_socket_name], node_separate.inputs['Image'])
+            group_tree.links.new(node_separate.outputs['A'], node_alpha.inputs[0])
+            group_tree.links.new(group_inputs.outputs[alpha_socket_name], node_alpha.inputs[1])
+
+            # mixing the wireframe color into the view layer image
+            group_tree.inputs.new('NodeSocketColor', image_socket_name)
+            group_tree.outputs.new('NodeSocketColor', image_socket_name)
+            tree.links.new(node_v_layer.outputs['Image'], node_group.inputs[image_socket_name])
+            group_tree.links.new(node_alpha.outputs[0], node_mix.inputs['Fac'])
+            group_tree.links.new(group_inputs.outputs[image_socket_name], node_mix.inputs[1])
+            group_tree.links.new(group_inputs.outputs[color_socket_name], node_mix.inputs[2])
+            group_tree.links.new(node_mix.outputs['Image'], group_outputs.inputs[image_socket_name])
 
-    def set_up_material(self, name, material_props):
+            for link in links:
+                tree.links.new(node_group.outputs[image_socket_name], link.to_socket)
+
+        for node in chain(tree.nodes, group_tree.nodes):
+            node.select = False
+
+    def set_up_base_material(self, meshes):
+        """Adds the base material to the given affected meshes."""
+        base_mat = self.material_base
+
+        for mesh in meshes:
+            if mesh in self.shared_meshes:
+                for obj in self.mesh_users[mesh]:
+                    utils.set_object_materials(obj, base_mat)
+                continue
+
+            mat_index = utils.find_or_append_material(mesh, base_mat)
+            self.stats.count('polygons_touched', utils.set_material_index(mesh, mat_index))
+
+    def get_material_role(self, name, use_wireframe=False):
+        """
+        :return: The role of a material created by set_up_material.
+        """
+        # materials with a wireframe or AO are kept apart from those without
+        return name + (' Wireframe' if use_wireframe else '') + (' AO' if self.use_shader_ao else '')
+
+    def set_up_material(self, name, material_props, record_prop, use_wireframe=False):
+        """
+        Gets the material to use for a role, creating it if needed.
+
+        :param name: The role, also the name of a created material.
+        :param material_props: The role's material settings.
+        :param record_prop: The name of the record's property for the material.
+        :param use_wireframe: Whether to draw the wireframe in a created material, see utils.create_basic_material.
+        :return: The material.
+        """
         # if the user selected a material, use it
         if material_props.mode == 'EXISTING':
-            material = material_props.material
+            return material_props.material
+
+        role = self.get_material_role(name, use_wireframe)
+
+        # else, reuse the one created by a previous setup or a matching one created before
+        material = getattr(self.record, record_prop)
+        if not material or material.get(utils.MATERIAL_ROLE_PROP) != role:
+            material = utils.get_cached_material(role, self.wirebomb.id_data)
 
         # else, create a new one with the color selected
-        else:
-            material = utils.create_basic_material(name, material_props.color)
+        if not material:
+            ao_factor = self.wirebomb.ao_factor if self.use_shader_ao else None
+            wireframe_props = self.wirebomb.material_wireframe
+            wireframe_rgba = wireframe_props.color if use_wireframe else None
+            material = utils.create_basic_material(name, material_props.color, ao_factor, wireframe_rgba,
+                                                   self.wirebomb.thickness_shader)
+            utils.cache_material(material, role, self.wirebomb.id_data)
+            self.stats.count('datablocks_created')
             node_tree = material.node_tree
 
             # driving all color channels
             driving_prop = material_props.color.path_from_id()
+            color_path = utils.get_color_path(node_tree)
             for i in range(4):
                 self.add_driver(driving_prop, material, 'diffuse_color', i, i)
-                self.add_driver(driving_prop, node_tree, 'nodes["color"].inputs[0].default_value', i, i)
+                self.add_driver(driving_prop, node_tree, color_path, i, i)
             # 3 = alpha channel index
-            self.add_driver(driving_prop, material.node_tree, 'nodes["alpha"].inputs[0].default_value', 3)
-
+            self.add_driver(driving_prop, node_tree, utils.get_alpha_path(node_tree), 3)
+            if ao_factor is not None:
+                self.add_driver(self.wirebomb.path_from_id('ao_factor'), node_tree,
+                                'nodes["ao"].inputs[0].default_value')
+            if use_wireframe:
+                driving_prop = wireframe_props.color.path_from_id()
+                for i in range(3):
+                    self.add_driver(driving_prop, node_tree, 'nodes["wireframe_color"].outputs[0].default_value', i, i)
+                self.add_driver(driving_prop, node_tree, 'nodes["alpha_wireframe"].outputs[0].default_value', 3)
+                self.add_driver(self.wirebomb.path_from_id('thickness_shader'), node_tree,
+                                'nodes["wireframe"].inputs[0].default_value')
+
+        setattr(self.record, record_prop, material)
         return material
 
     def add_driver(self, driving_prop, driven_id, driven_prop, driving_index=-1, driven_index=-1):
         driver = driven_id.driver_add(driven_prop, driven_index).driver
+        self.stats.count('drivers_created')
         driver.type = 'AVERAGE'  # any except for 'SCRIPTED' since no need for expression
         var = driver.variables.new()
         target = var.targets[0]
         target.id_type = 'SCENE'
-        target.id = self.scene
+        # drivers follow the settings, which may belong to another scene than the one set up
+        target.id = self.wirebomb.id_data
         target.data_path = driving_prop if driving_index == -1 else f'{driving_prop}[{driving_index}]'
 
-    def set_up_wireframe_modifier(self):
-        wireframe_mat = self.set_up_material("Wireframe", self.wirebomb.material_wireframe)
-
-        for obj in self.meshes_affected:
-            modifier_wireframe = obj.modifiers.new(name='Wireframe', type='WIREFRAME')
-            modifier_wireframe.use_even_offset = False  # causes spikes on some models
-            modifier_wireframe.use_replace = False
-            self.add_driver(self.wirebomb.path_from_id('thickness_modifier'), modifier_wireframe, 'thickness')
-
-            obj.data.materials.append(wireframe_mat)
-            modifier_wireframe.material_offset = len(obj.material_slots) - 1
-
-    def set_up_wireframe_freestyle(self):
-        wireframe_coll = bpy.data.collections.new('Wireframe')
-        for obj in self.meshes_affected:
-            wireframe_coll.objects.link(obj)
-            for edge in obj.data.edges:
-                edge.use_freestyle_mark = True
+    def set_up_wireframe_modifier(self, meshes):
+        wireframe_mat = self.material_wireframe
+
+        for mesh in meshes:
+            material_offset = utils.find_or_append_material(mesh, wireframe_mat)
+
+            for obj in self.mesh_users[mesh]:
+                if obj in self.objects_over_budget:
+                    continue
+
+                modifier_wireframe = self.get_recorded_modifier(obj)
+                if modifier_wireframe:
+                    modifier_wireframe.material_offset = material_offset
+                    continue
+
+                modifier_wireframe = obj.modifiers.new(name='Wireframe', type='WIREFRAME')
+                modifier_wireframe.use_even_offset = False  # causes spikes on some models
+                modifier_wireframe.use_replace = False
+                modifier_wireframe.material_offset = material_offset
+                self.modifier_names[obj] = modifier_wireframe.name
+
+                if self.use_shared_thickness:
+                    # no driver, the thickness setting's update callback sets the thickness of all these at once
+                    modifier_wireframe.thickness = self.wirebomb.thickness_modifier
+                    item = self.wirebomb.shared_thickness_modifiers.add()
+                    item.name = modifier_wireframe.name
+                    item.object = obj
+                else:
+                    self.add_driver(self.wirebomb.path_from_id('thickness_modifier'), modifier_wireframe, 'thickness')
+
+    def set_up_freestyle_line_sets(self):
+        """Sets up the wireframe collection and the line sets rendering it, the objects are added to it later."""
+        wireframe_coll = self.record.wireframe_collection
+        if not wireframe_coll:
+            wireframe_coll = self.record.wireframe_collection = bpy.data.collections.new('Wireframe')
+            self.stats.count('datablocks_created')
+        self.wireframe_linked = set(wireframe_coll.objects)
 
         self.scene.render.use_freestyle = True
 
-        linestyle = bpy.data.linestyles.new('WireStyle')
-        self.add_driver(self.wirebomb.path_from_id('thickness_freestyle'), linestyle, 'thickness')
-        driving_color_prop = self.wirebomb.material_wireframe.path_from_id('color')
-        for i in range(3):
-            self.add_driver(driving_color_prop, linestyle, 'color', i, i)
-        self.add_driver(driving_color_prop, linestyle, 'alpha', 3)
+        linestyle = self.record.linestyle
+        if not linestyle:
+            linestyle = self.record.linestyle = bpy.data.linestyles.new('WireStyle')
+            self.stats.count('datablocks_created')
+            self.add_driver(self.wirebomb.path_from_id('thickness_freestyle'), linestyle, 'thickness')
+
+        # the color is either driven here, or applied in the compositor to lines rendered white and opaque
+        has_color_drivers = bool(linestyle.animation_data and linestyle.animation_data.drivers.find('alpha'))
+        if self.use_composite_wireframe and has_color_drivers:
+            linestyle.driver_remove('color')
+            linestyle.driver_remove('alpha')
+        elif not self.use_composite_wireframe and not has_color_drivers:
+            driving_color_prop = self.wirebomb.material_wireframe.path_from_id('color')
+            for i in range(3):
+                self.add_driver(driving_color_prop, linestyle, 'color', i, i)
+            self.add_driver(driving_color_prop, linestyle, 'alpha', 3)
+        if self.use_composite_wireframe:
+            linestyle.color = (1, 1, 1)
+            linestyle.alpha = 1
 
         for v_layer in self.scene.view_layers:
+            # else the lines are rendered into the image, also when switching back from compositing them
+            v_layer.freestyle_settings.as_render_pass = self.use_composite_wireframe
             line_sets = v_layer.freestyle_settings.linesets
+            if any(line_set.linestyle == linestyle for line_set in line_sets):
+                # set up by a previous run
+                continue
+
             for line_set in line_sets:
-                line_set.show_render = False
+                if line_set.show_render:
+                    line_set.show_render = False
+                    item = self.record.disabled_line_sets.add()
+                    item.name = line_set.name
+                    item.view_layer = v_layer.name
             line_set = line_sets.new('Wireframe')
 
             # edge types settings
@@ -265,9 +843,25 @@ class Wirebomb:
 
             line_set.linestyle = linestyle
 
+    def set_up_wireframe_freestyle(self, meshes):
+        """Adds the users of the given meshes to the wireframe collection and marks the meshes' edges."""
+        wireframe_coll = self.record.wireframe_collection
+        for mesh in meshes:
+            for obj in self.mesh_users[mesh]:
+                if obj not in self.wireframe_linked:
+                    wireframe_coll.objects.link(obj)
+                    self.wireframe_linked.add(obj)
+        self.stats.count('edges_touched', utils.mark_freestyle_edges(meshes, self.feature_angle))
+
     def set_up_world_ao(self):
-        """Sets up a new world with AO."""
-        new_world = bpy.data.worlds.new('World of Wirebomb')
+        """Sets up a new world with AO, or reuses the recorded one."""
+        if self.record.world:
+            self.scene.world = self.record.world
+            return
+
+        self.record.original_world = self.scene.world
+        new_world = self.record.world = bpy.data.worlds.new('World of Wirebomb')
+        self.stats.count('datablocks_created')
         new_world.light_settings.use_ambient_occlusion = True
         new_world.light_settings.ao_factor = 0.3
         new_world.use_nodes = True
@@ -280,24 +874,8 @@ class Wirebomb:
 
     def find_meshes_affected(self):
         """Finds and returns all affected meshes."""
-        meshes_affected = set()
-
-        if self.wirebomb.affect_mode == 'EXCLUSIVE':
-            meshes_affected = {o for o in self.scene.objects if o.type == 'MESH'}
-
-        update_method = 'update' if self.wirebomb.affect_mode == 'INCLUSIVE' else 'difference_update'
-        update_meshes_affected = getattr(meshes_affected, update_method)
-
-        if self.wirebomb.use_affect_selected:
-            previous_area = bpy.context.area.type
-            bpy.context.area.type = 'VIEW_3D'
-            update_meshes_affected(o for o in self.scene.objects if o.select_get() and o.type == 'MESH')
-            bpy.context.area.type = previous_area
-        if self.wirebomb.use_affect_collections:
-            for coll in map(attrgetter('value'), self.wirebomb.collections_affected):
-                update_meshes_affected(o for o in coll.all_objects if o.type == 'MESH')
-
-        return meshes_affected
+        # not using the UI's cache since the scene may have changed without the depsgraph being evaluated
+        return selection.resolve(self.scene, self.view_layer, self.wirebomb)
 
     def error_check(self):
         """
@@ -315,6 +893,10 @@ class Wirebomb:
                 and not self.wirebomb.material_base.material):
             error_msg += '- No base material selected.\n'
 
+        if self.use_shader_wireframe and not (self.wirebomb.use_base and self.wirebomb.material_base.mode == 'COLOR'):
+            error_msg += '- The Shader wireframe method draws the wireframe in the base material, use a new base ' \
+                         'material from a color.\n'
+
         return error_msg.rstrip()
 
 